@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#-------------------------------------------------------
+# Usage: python3 -m bench [-l] [-t TAG] [NAME...]
+# Description: benchmark registry and discovery for the whole tree
+#-------------------------------------------------------
+
+
+
+'''
+bench: one registry for the benchmarks scattered across the chapters.
+A case is a function taking no arguments, declared either with the
+@bench.case decorator (optionally giving name and tags) or just by
+naming it bench_something at the top level of its module; a tags
+attribute on such a function plays the decorator's tags role, so
+scripts outside this chapter need not import this package at all.
+discover() walks the tree, imports only files whose text mentions a
+case, and collects them; importing a case module must not run its
+benchmark, so scripts keep their demo runs under __name__ == '__main__'
+(load() raises if importing one prints anything).
+A case returns pybench records (dicts), (label, seconds) pairs, or
+None; run() prints them all in one format: name, label, seconds.
+'''
+
+
+import io, os, sys, time, fnmatch, contextlib, collections, importlib.util
+
+
+Case = collections.namedtuple('Case', 'name func tags path')
+
+registry = collections.OrderedDict()                    # name => Case
+treeroot = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+prefix = 'bench_'
+
+
+
+def register(func, name=None, tags=(), path=None):
+    module = sys.modules.get(func.__module__)
+    path = path or getattr(module, '__file__', None) or func.__module__
+    stem = os.path.splitext(os.path.basename(path))[0]
+    base = func.__name__[len(prefix):] if func.__name__.startswith(prefix) else func.__name__
+    name = name or '%s.%s' % (stem, base)
+    registry[name] = Case(name, func, tuple(tags), path)
+    func.benchname = name
+    return func
+
+
+def case(func=None, name=None, tags=()):
+    '''
+    Decorator: @case, or @case(name='x', tags=['y']).
+    '''
+    if func is None:
+        return lambda func: register(func, name, tags)
+    return register(func)
+
+
+def mentions(path):
+    '''
+    Cheap text test, so discovery never imports ordinary scripts.
+    '''
+    try:
+        with open(path, encoding='utf-8', errors='replace') as file:
+            text = file.read()
+    except (IOError, OSError):
+        return False
+    return ('def ' + prefix) in text or '@bench.case' in text or '@case' in text
+
+
+def modname(path):
+    return 'benchcase_' + ''.join(c if c.isalnum() else '_'
+                                  for c in os.path.relpath(path, treeroot)[:-3])
+
+
+def load(path):
+    '''
+    Import a file by path under a unique name, with its own directory
+    on sys.path so its sibling imports work; collects bench_ functions.
+    A module that prints while imported is running a demo or benchmark
+    it should keep under __main__: RuntimeError.
+    '''
+    dirname = os.path.dirname(path)
+    sys.path.insert(0, dirname)
+    printed = io.StringIO()
+    try:
+        spec = importlib.util.spec_from_file_location(modname(path), path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        with contextlib.redirect_stdout(printed):
+            spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(dirname)
+    if printed.getvalue():
+        raise RuntimeError('importing %s printed %r: keep its demo under __main__'
+                           % (os.path.relpath(path, treeroot), printed.getvalue()[:80]))
+    known = set(id(case.func) for case in registry.values())
+    for (attr, value) in sorted(vars(module).items()):
+        if (attr.startswith(prefix) and callable(value) and id(value) not in known
+                and getattr(value, '__module__', None) == module.__name__):
+            register(value, tags=getattr(value, 'tags', ()), path=path)
+    return module
+
+
+def discover(root=None):
+    '''
+    Find and register every case under root (default: the whole tree).
+    '''
+    for (dirpath, dirnames, filenames) in os.walk(root or treeroot):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith(('.', '__')))
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            if filename.endswith('.py') and dirpath != os.path.dirname(__file__) and mentions(path):
+                load(path)
+    return registry
+
+
+def select(patterns=(), tags=()):
+    '''
+    Cases whose name matches any pattern (glob; plain words match as
+    substrings) and that carry every tag given; all if neither given.
+    '''
+    chosen = []
+    for case in registry.values():
+        if patterns and not any(fnmatch.fnmatch(case.name, pat if any(c in pat for c in '*?[')
+                                                else '*%s*' % pat) for pat in patterns):
+            continue
+        if not set(tags) <= set(case.tags):
+            continue
+        chosen.append(case)
+    return chosen
+
+
+def results(value):
+    '''
+    Normalize a case's return value to [(label, seconds)].
+    '''
+    pairs = []
+    for item in value or []:
+        if isinstance(item, dict):
+            pairs.append((item['stmt'], item['min']))
+        else:
+            pairs.append((str(item[0]), item[1]))
+    return pairs
+
+
+def run(cases, out=None):
+    '''
+    Run cases in order, printing each one's results and wall time.
+    '''
+    out = out or sys.stdout
+    summary = []
+    for case in cases:
+        out.write('=' * 80 + '\n')
+        out.write('%s  [%s]\n' % (case.name, ', '.join(case.tags)))
+        start = time.perf_counter()
+        value = case.func()
+        elapsed = time.perf_counter() - start
+        for (label, seconds) in results(value):
+            out.write('%-32s %-40.40r %12.6g\n' % (case.name, label, seconds))
+        out.write('%s: wall time %.3f sec\n' % (case.name, elapsed))
+        summary.append((case.name, elapsed))
+    return summary
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#-------------------------------------------------------
+# Usage: python3 -m bench [-l] [-t TAG]... [-root DIR] [NAME...]
+# Description: command-line entry point for the benchmark registry
+#-------------------------------------------------------
+
+
+
+'''
+python3 -m bench            run every case found in the tree
+python3 -m bench -l         list cases (name, tags, file) without running
+python3 -m bench -t slots   run only cases tagged slots (repeatable)
+python3 -m bench pybench    run cases whose name contains pybench, or
+                            matches a glob such as 'timeseqs*'
+-root DIR limits discovery to one directory of the tree.
+'''
+
+
+import sys, os
+import bench
+
+
+
+def parse(argv):
+    names, tags, root, listing = [], [], None, False
+    args = iter(argv)
+    for arg in args:
+        if arg == '-l':
+            listing = True
+        elif arg == '-t':
+            tags.append(next(args))
+        elif arg == '-root':
+            root = next(args)
+        else:
+            names.append(arg)
+    return (names, tags, root, listing)
+
+
+
+if __name__ == '__main__':
+    (names, tags, root, listing) = parse(sys.argv[1:])
+    bench.discover(root)
+    cases = bench.select(names, tags)
+    if listing:
+        for case in cases:
+            print('%-36s %-24s %s' % (case.name, ','.join(case.tags),
+                                      os.path.relpath(case.path, bench.treeroot)))
+    else:
+        print(sys.version)
+        bench.run(cases)
+    if not cases:
+        print('no benchmark cases matched')
+        sys.exit(1)
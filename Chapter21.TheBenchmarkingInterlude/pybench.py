@@ -14,59 +14,325 @@ pybench.py: Test speed of one or more Pythons on a set of simple
 code-string benchmarks. A function, to allow stmts to vary.
 This system itself runs on both 2.X and 3.X, and may spawn both.
 Uses timeit to test either the Python running this script by API
-calls, or a set of Pythons by reading spawned command-line outputs
-(os.popen) with Python's -m flag to find timeit on module search path.
+calls, or a set of Pythons by spawning the pybench_child.py harness
+in each: the job goes to the child as JSON on its stdin and the child
+sends back every repeat's raw time as JSON, so there is no shell quoting
+of stmts and no "usec per loop" text to parse.
 Replaces $listif3 with a list() around generators for 3.X and an
-empty string for 2.X, so 3.X does same work as 2.X. In command-line
-mode only, must split multiline statements into one separate quoted
-argument per line so all will be run (else might run/time first line
-only), and replace all \t in indentation with 4 spaces for uniformity.
-Caveats: command-line mode (only) may fail if test stmt embeds double
-quotes, quoted stmt string is incompatible with shell in general, or
-command-line exceeds a length limit on platform's shell--use API call
-mode or homegrown timer; does not yet support a setup statement: as is,
-time of all statements in the test stmt are charged to the total time.
+empty string for 2.X, so 3.X does same work as 2.X, and replaces all
+\t in indentation with 4 spaces for uniformity. Does not yet support a
+setup statement: as is, time of all statements in the test stmt are
+charged to the total time (see pybench2).
+Each run yields one structured record -- python, version, stmt, setup,
+number, repeat, the raw repeat times, and their min, median, mean,
+stdev and IQR -- which runner() returns and, given output='x.jsonl' or
+output='x.csv', also writes as JSON Lines or CSV.
+Command-line mode may also run the (stmt, python) matrix concurrently:
+pass workers=N to schedule all the spawned command lines over a pool of
+N workers, each pinned to its own CPU where the platform supports it,
+so runs don't share a core: the worker's CPU goes in the job as "cpu",
+and the child pins itself with os.sched_setaffinity before timing (no
+preexec_fn, which isn't safe with the pool's threads running); results
+are still reported in the original stmt/python order.
+Fixed number/repeat counts suit few stmts: adaptive=True (or a dict of
+pybench_child.adaptive options) instead picks number per stmt so each
+repeat takes a target time, then adds repeats until the relative
+standard error of the mean is small enough or a time budget runs out,
+in both API and spawned modes.
+profile='cprofile' or 'sample' adds a last pass that reruns each record's
+stmt in a fresh child under cProfile or a stack sampler, and writes
+.prof and/or flamegraph-ready .collapsed files to profiledir; profiling
+never shares a process with the timing pass.
+A pythons entry may also name a pybench_agent listening on a socket,
+'agent:HOST:PORT' or 'agent:/path/to/socket', to time a Python on
+another host or in a container: the agent runs the same jobs with its
+own interpreter, and several agents are driven in parallel (pybench_agent
+is imported only then).
 '''
 
 
-import sys, os, timeit
+import sys, os, timeit, json, subprocess, pybench_child
 
 
 defnum, defrep = 1000, 5
+harness = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pybench_child.py')
+fields = ['python', 'version', 'stmt', 'source', 'setup', 'number', 'repeat',
+          'times', 'min', 'median', 'mean', 'stdev', 'iqr',
+          'peak', 'blocks', 'maxrss']
 
 
 
-def runner(stmts, pythons=None, tracecmd=False):
+def cpulist():
+    '''
+    CPUs this process may run on, in order; None if affinity is unknown.
+    '''
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return None
+
+
+def spawn(cmd, text=None):
+    '''
+    Run one shell command line, feeding it text on stdin, return its
+    stdout text.
+    '''
+    proc = subprocess.Popen(cmd, shell=True, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, universal_newlines=True)
+    return proc.communicate(text)[0]
+
+
+def pinjob(text, cpu):
+    '''
+    JSON job text with "cpu" added, for pybench_child to pin itself to;
+    text as is if there's no cpu or no job.
+    '''
+    if cpu is None or not text:
+        return text
+    job = json.loads(text)
+    job['cpu'] = cpu
+    return json.dumps(job)
+
+
+def isagent(cmd):
+    return cmd.startswith('agent:')                     # pybench_agent.scheme, without importing it
+
+
+def runcmds(cmds, workers=None, inputs=None):
+    '''
+    Run shell command lines, yielding each one's output text in order.
+    inputs: None, or one stdin text per command line
+    workers: None or 1=serial, else a pool of N threads that each spawn
+    one command at a time; a worker's jobs carry that worker's CPU for
+    their child to pin itself to, and N is capped at the CPU count.
+    Agent entries ('agent:ADDRESS', see childcmd) go to pybench_agent
+    instead, all agents in parallel with each other and the local runs.
+    '''
+    inputs = inputs or [None] * len(cmds)
+    if any(isagent(cmd) for cmd in cmds):
+        import pybench_agent                            # Remote pythons only
+        remote = [pos for (pos, cmd) in enumerate(cmds) if isagent(cmd)]
+        get = pybench_agent.fanout([cmds[pos] for pos in remote], [inputs[pos] for pos in remote])
+        local = runcmds([cmd for cmd in cmds if not isagent(cmd)], workers,
+                        [text for (cmd, text) in zip(cmds, inputs) if not isagent(cmd)])
+        slots = dict((pos, slot) for (slot, pos) in enumerate(remote))
+        for pos in range(len(cmds)):
+            yield get(slots[pos]) if pos in slots else next(local)
+        return
+    if not workers or workers < 2:
+        for (cmd, text) in zip(cmds, inputs):
+            yield spawn(cmd, text)
+        return
+
+    import threading                                    # 3.X only: pool mode
+    from concurrent.futures import ThreadPoolExecutor
+
+    cpus = cpulist()
+    if cpus:
+        workers = min(workers, len(cpus))
+    free = list(cpus or [])
+    local = threading.local()
+    lock = threading.Lock()
+
+    def pin():                                          # Per-worker start-up
+        with lock:
+            local.cpu = free.pop(0) if free else None
+
+    def run(job):
+        return spawn(job[0], pinjob(job[1], getattr(local, 'cpu', None)))
+
+    with ThreadPoolExecutor(max_workers=workers, initializer=pin) as pool:
+        for output in pool.map(run, zip(cmds, inputs)):  # map keeps cmds order
+            yield output
+
+
+def childcmd(python):
+    '''
+    Command line that runs the timing harness under python; an agent
+    entry ('agent:HOST:PORT' or 'agent:/socket/path') stands for itself.
+    '''
+    if isagent(python):
+        return python
+    return '%s "%s"' % (python, harness)
+
+
+def quantile(ordered, frac):
+    '''
+    Linearly interpolated quantile of an already sorted list.
+    '''
+    pos = (len(ordered) - 1) * frac
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def summarize(times):
+    '''
+    Summary statistics of a list of raw repeat times, as a dict.
+    '''
+    ordered = sorted(times)
+    count = len(ordered)
+    mean = sum(ordered) / float(count)
+    var = sum((t - mean) ** 2 for t in ordered) / (count - 1) if count > 1 else 0.0
+    return {'min':    ordered[0],
+            'median': quantile(ordered, 0.5),
+            'mean':   mean,
+            'stdev':  var ** 0.5,
+            'iqr':    quantile(ordered, 0.75) - quantile(ordered, 0.25)}
+
+
+def record(python, version, stmt, setup, number, repeat, times, source=None):
+    '''
+    One structured result: the run's inputs, raw times, and their stats.
+    source is the stmt as given, before $listif3 and tab replacement, so
+    one stmt run on 2.X and 3.X pythons can be grouped (default: stmt).
+    '''
+    rec = dict(python=python, version=version, stmt=stmt, source=source or stmt, setup=setup,
+               number=number, repeat=repeat, times=list(times),
+               peak=None, blocks=None, maxrss=None)     # Memory: pybench2 only
+    rec.update(summarize(times))
+    return rec
+
+
+def writerecords(records, filename):
+    '''
+    Save records as CSV if filename ends in .csv, else as JSON Lines;
+    in CSV the raw times are one space-separated column.
+    '''
+    if filename.endswith('.csv'):
+        import csv
+        with open(filename, 'w') as file:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            for rec in records:
+                row = dict(rec)
+                row['times'] = ' '.join(repr(t) for t in rec['times'])
+                writer.writerow(dict((key, row.get(key)) for key in fields))
+    else:
+        with open(filename, 'w') as file:
+            for rec in records:
+                file.write(json.dumps(rec) + '\n')
+
+
+def readrecords(filename):
+    '''
+    Load records saved by writerecords, from JSON Lines or CSV.
+    '''
+    if filename.endswith('.csv'):
+        import csv
+        records = []
+        with open(filename) as file:
+            for row in csv.DictReader(file):
+                row['times'] = [float(t) for t in row['times'].split()]
+                for key in ('number', 'repeat'):
+                    row[key] = int(row[key])
+                for key in ('min', 'median', 'mean', 'stdev', 'iqr'):
+                    row[key] = float(row[key])
+                for key in ('peak', 'blocks', 'maxrss'):
+                    row[key] = int(row[key]) if row.get(key) else None
+                records.append(row)
+        return records
+    with open(filename) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def profilepass(pythons, jobs, mode, dirname='profiles', workers=None):
+    '''
+    Profile each job once more in a fresh child of its python, after and
+    apart from timing; mode is 'cprofile' or 'sample'. Files go in
+    dirname, named by stmt index, python and mode; returns their names.
+    '''
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    cmds = [childcmd(python) for python in pythons]
+    texts = []
+    for (count, (python, job)) in enumerate(zip(pythons, jobs)):
+        job = dict(job, profile=mode)
+        job.pop('adaptive', None)
+        tag = ''.join(c if c.isalnum() else '_' for c in os.path.basename(python))
+        job['base'] = os.path.abspath(os.path.join(dirname, '%03d-%s-%s' % (count, tag, mode)))
+        texts.append(json.dumps(job))
+    files = []
+    for out in runcmds(cmds, workers, texts):
+        files.extend(json.loads(out)['files'])
+    return files
+
+
+def runner(stmts, pythons=None, tracecmd=False, workers=None, output=None,
+           adaptive=None, profile=None, profiledir='profiles'):
     '''
     Main logic: run tests per input lists, caller handles usage modes.
     stmts: [(number?, repeat?, stmt-string)], replaces $listif3 in stmt
     pythons: None=this python only, or [(ispy3?, python-executable-path)]
+    workers: None=run command lines serially, or N concurrent workers
+    output: None, or a .jsonl/.csv filename to write the records to
+    adaptive: None=use each stmt's number/repeat, else True or a dict of
+    pybench_child.adaptive options to calibrate number and repeat per stmt
+    profile: None, or 'cprofile'/'sample' to profile every run afterwards,
+    writing .prof/.collapsed files to profiledir (see pybench_profile)
+    Returns the list of records, in stmt/python order.
     '''
     print(sys.version)
-    for (number, repeat, stmt) in stmts:
-        number = number or defnum
-        repeat = repeat or defrep       # 0 = default
+    records = []
+    if adaptive is not None and not isinstance(adaptive, dict):
+        adaptive = {} if adaptive else None             # True: default options
+    if not pythons:
+        for (number, repeat, stmt) in stmts:
+            number = number or defnum
+            repeat = repeat or defrep       # 0 = default
 
-        if not pythons:
             # Run stmt on this python: API call
             # No need to split lines or quote here
             ispy3 = sys.version[0] == '3'
-            stmt = stmt.replace('$listif3', 'list' if ispy3 else '')
-            best = min(timeit.repeat(stmt=stmt, number=number, repeat=repeat))
-            print('%.4f [%r]' % (best, stmt[:70]))
-        else:
-            # Run stmt on all pythons: command line
-            # Split lines into quoted arguments
-            print('-' * 80)
-            print('[%r]' % stmt)
+            (source, stmt) = (stmt, stmt.replace('$listif3', 'list' if ispy3 else ''))
+            if adaptive is not None:
+                (number, times) = pybench_child.adaptive(stmt, '', **adaptive)
+                repeat = len(times)
+            else:
+                times = timeit.repeat(stmt=stmt, number=number, repeat=repeat)
+            rec = record(sys.executable, sys.version, stmt, '', number, repeat, times, source)
+            records.append(rec)
+            print('%.4f [%r]' % (rec['min'], stmt[:70]))
+    else:
+        # Run stmt on all pythons: spawned harness
+        # Build the whole (stmt, python) matrix first, so it can be scheduled
+        matrix = []
+        for (index, (number, repeat, stmt)) in enumerate(stmts):
+            number = number or defnum
+            repeat = repeat or defrep
             for (ispy3, python) in pythons:
                 stmt1 = stmt.replace('$listif3', 'list' if ispy3 else '')
                 stmt1 = stmt1.replace('\t', ' ' * 4)
-                lines = stmt1.split('\n')
-                args = ' '.join('"%s"' % line for line in lines)
-                cmd = '%s -m timeit -n %s -r %s %s' % (python, number, repeat, args)
-                print(python)
-                if tracecmd: 
-                    print(cmd)
-                print('\t' + os.popen(cmd).read().rstrip())
+                job = dict(stmt=stmt1, setup='', number=number, repeat=repeat)
+                if adaptive is not None:
+                    job['adaptive'] = adaptive
+                matrix.append((index, stmt, python, job))
+
+        cmds = [childcmd(python) for (index, stmt, python, job) in matrix]
+        jobs = [json.dumps(job) for (index, stmt, python, job) in matrix]
+        outputs = runcmds(cmds, workers, jobs)
+        last = None
+        for ((index, stmt, python, job), out) in zip(matrix, outputs):
+            if index != last:
+                print('-' * 80)
+                print('[%r]' % stmt)
+                last = index
+            print(python)
+            if tracecmd: 
+                print('%s <<< %s' % (childcmd(python), json.dumps(job)))
+            res = json.loads(out)
+            rec = record(python, res['version'], job['stmt'], job['setup'],
+                         res.get('number', job['number']), len(res['times']), res['times'], stmt)
+            records.append(rec)
+            print('\t%.4f (median %.4f, stdev %.4f) [%s loops, %s repeats]' %
+                  (rec['min'], rec['median'], rec['stdev'], rec['number'], rec['repeat']))
+
+    if profile:                                         # Separate pass: timings stay clean
+        jobs = [dict(stmt=rec['stmt'], setup=rec['setup'], number=rec['number'])
+                for rec in records]
+        for name in profilepass([rec['python'] for rec in records], jobs, profile,
+                                profiledir, workers):
+            print('profile: %s' % name)
 
+    if output:
+        writerecords(records, output)
+    return records
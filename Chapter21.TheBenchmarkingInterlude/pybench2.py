@@ -13,62 +13,208 @@
 pybench2.py: Test speed of one or more Pythons on a set of simple
 code-string benchmarks. A function, to allow stmts to vary.
 This system itself runs on both 2.X and 3.X, and may spawn both.
-Uses timeit to test either the Python running this script by API
-calls, or a set of Pythons by reading spawned command-line outputs
-(os.popen) with Python's -m flag to find timeit on module search path.
+Same as pybench, but each stmt also has a setup string whose time is
+not charged: stmts are (number, repeat, setup, stmt). Uses timeit to
+test either the Python running this script by API calls, or a set of
+Pythons by spawning the pybench_child.py harness in each, which gets
+the job as JSON on stdin and returns every repeat's raw time as JSON.
 Replaces $listif3 with a list() around generators for 3.X and an
-empty string for 2.X, so 3.X does same work as 2.X. In command-line
-mode only, must split multiline statements into one separate quoted
-argument per line so all will be run (else might run/time first line
-only), and replace all \t in indentation with 4 spaces for uniformity.
-Caveats: command-line mode (only) may fail if test stmt embeds double
-quotes, quoted stmt string is incompatible with shell in general, or
-command-line exceeds a length limit on platform's shell--use API call
-mode or homegrown timer; does not yet support a setup statement: as is,
-time of all statements in the test stmt are charged to the total time.
+empty string for 2.X, so 3.X does same work as 2.X, and replaces all
+\t in indentation with 4 spaces for uniformity.
+runner() returns one structured record per run (see pybench.record),
+optionally written to a .jsonl or .csv output file; as in pybench,
+workers=N runs the spawned matrix concurrently on a pool of CPU-pinned
+workers, reporting in the original order. adaptive=True (or a dict of
+options) picks number and repeat per stmt, as in pybench.
+memory=True adds a separate, untimed pass that runs each stmt once in
+a fresh spawned child (this python in API mode) to record its peak
+tracemalloc bytes, the blocks it leaves allocated, and the child's max
+RSS; these go in each record and are printed next to its time.
+profile='cprofile' or 'sample' profiles every run afterwards, as in pybench.
+In API mode, setup (and an optional fifth teardown item per stmt) may
+also be callables: setup() may return the dict the stmt runs in, and
+teardown gets it back. scope='loop' reruns them around every stmt run
+instead of every repeat, timing just the stmt; nogc=False leaves GC on
+while timing; interleave=True round-robins the repeats of all stmts, so
+competing stmts see the same CPU frequency and heap conditions (in a
+spawned python, one child runs the whole interleaved batch).
 '''
 
 
-import sys, os, timeit
+import sys, json, pybench_child
+from pybench import runcmds, childcmd, record, writerecords, profilepass
 
 
 defnum, defrep = 1000, 5
 
 
 
-def runner(stmts, pythons=None, tracecmd=False):
+def memorypass(pythons, jobs, workers=None):
+    '''
+    Run each job once more in a fresh child of its python, as a memory
+    job; returns one pybench_child.memory result dict per job.
+    '''
+    cmds = [childcmd(python) for python in pythons]
+    texts = []
+    for job in jobs:
+        job = dict(job, memory=True)
+        job.pop('adaptive', None)
+        texts.append(json.dumps(job))
+    return [json.loads(out) for out in runcmds(cmds, workers, texts)]
+
+
+def showmemory(rec):
+    if rec['peak'] is None:
+        return ''
+    return '  [peak %.1f KB, %s blocks, maxrss %s KB]' % (rec['peak'] / 1024.0,
+                                                         rec['blocks'], rec['maxrss'])
+
+
+def describe(code):
+    '''
+    Text for a setup/stmt/teardown in records: strings as is, callables by name.
+    '''
+    if callable(code):
+        return '<callable %s>' % getattr(code, '__name__', type(code).__name__)
+    return code or ''
+
+
+def runner(stmts, pythons=None, tracecmd=False, workers=None, output=None,
+           adaptive=None, memory=False, profile=None, profiledir='profiles',
+           scope='repeat', nogc=True, interleave=False):
     '''
     Main logic: run tests per input lists, caller handles usage modes.
-    stmts: [(number?, repeat?, stmt-string)], replaces $listif3 in stmt
+    stmts: [(number?, repeat?, setup, stmt[, teardown])], replaces $listif3 in stmt;
+    setup/teardown are strings, or callables in API mode (see pybench_child.maketimer)
     pythons: None=this python only, or [(ispy3?, python-executable-path)]
+    workers: None=run command lines serially, or N concurrent workers
+    output: None, or a .jsonl/.csv filename to write the records to
+    adaptive: None=use each stmt's number/repeat, else True or a dict of
+    pybench_child.adaptive options to calibrate number and repeat per stmt
+    memory: True=also record peak memory, blocks and max RSS per run
+    profile: None, or 'cprofile'/'sample' to profile every run afterwards,
+    writing .prof/.collapsed files to profiledir (see pybench_profile)
+    scope: 'repeat'=setup/teardown around each repeat, 'loop'=around each stmt run
+    nogc: False=leave garbage collection on while timing
+    interleave: True=round-robin the stmts' repeats (each stmt's own number/repeat;
+    not with adaptive, which picks number and repeat one stmt at a time)
+    Returns the list of records, in stmt/python order.
     '''
     print(sys.version)
-    for (number, repeat, setup, stmt) in stmts:
-        number = number or defnum
-        repeat = repeat or defrep       # 0 = default
-
-        if not pythons:
-            # Run stmt on this python: API call
-            # No need to split lines or quote here
-            ispy3 = sys.version[0] == '3'
-            stmt = stmt.replace('$listif3', 'list' if ispy3 else '')
-            best = min(timeit.repeat(setup=setup, stmt=stmt, number=number, repeat=repeat))
-            print('%.4f [%r]' % (best, stmt[:70]))
-        else:
-            # Run stmt on all pythons: command line
-            # Split lines into quoted arguments
-            print('-' * 80)
-            print('[%r]' % stmt)
-            setup = setup.replace('\t', ' ' * 4)
-            setup = ' '.join('-s "%s"' % line for line in setup.split('\n'))
+    records, plains = [], []
+    if adaptive is not None and not isinstance(adaptive, dict):
+        adaptive = {} if adaptive else None             # True: default options
+    if interleave and adaptive is not None:
+        raise ValueError('interleave and adaptive can\'t be combined: interleaving runs '
+                         'each stmt\'s own number and repeat')
+    entries = []
+    for entry in stmts:
+        (number, repeat, setup, stmt, teardown) = (tuple(entry) + (None,))[:5]
+        entries.append((number or defnum, repeat or defrep, setup, stmt, teardown))
+    plain = lambda setup, stmt, teardown: not any(callable(x) for x in (setup, stmt, teardown))
+
+    if not pythons:
+        ispy3 = sys.version[0] == '3'
+        sources = [describe(entry[3]) for entry in entries]
+        entries = [(number, repeat, setup,
+                    stmt.replace('$listif3', 'list' if ispy3 else '') if not callable(stmt) else stmt,
+                    teardown) for (number, repeat, setup, stmt, teardown) in entries]
+        mems = {}
+        if memory:                                      # Before timing: own pass
+            indexes = [index for (index, entry) in enumerate(entries) if plain(*entry[2:])]
+            jobs = [dict(stmt=entries[i][3], setup=entries[i][2]) for i in indexes]
+            mems = dict(zip(indexes, memorypass([sys.executable] * len(jobs), jobs, workers)))
+
+        # Run stmt on this python: API call
+        # No need to split lines or quote here
+        runs = [pybench_child.maketimer(stmt, setup, teardown, scope, nogc)
+                for (number, repeat, setup, stmt, teardown) in entries]
+        if interleave:
+            alltimes = pybench_child.interleaved(runs, [entry[0] for entry in entries],
+                                                 [entry[1] for entry in entries])
+
+        for (index, (number, repeat, setup, stmt, teardown)) in enumerate(entries):
+            if interleave:
+                times = alltimes[index]
+            elif adaptive is not None:
+                (number, times) = pybench_child.adaptive(stmt, setup, teardown=teardown,
+                                                         scope=scope, nogc=nogc, **adaptive)
+            else:
+                times = [runs[index](number) for rep in range(repeat)]
+            rec = record(sys.executable, sys.version, describe(stmt), describe(setup),
+                         number, len(times), times, sources[index])
+            if index in mems:
+                rec.update((key, mems[index][key]) for key in ('peak', 'blocks', 'maxrss'))
+            records.append(rec)
+            plains.append(plain(setup, stmt, teardown))
+            print('%.4f [%r]%s' % (rec['min'], rec['stmt'][:70], showmemory(rec)))
+    else:
+        # Run stmt on all pythons: spawned harness
+        # Build the whole (stmt, python) matrix first, so it can be scheduled
+        matrix = []
+        for (index, (number, repeat, setup, stmt, teardown)) in enumerate(entries):
+            if not plain(setup, stmt, teardown):
+                raise TypeError('spawned pythons take only string setup, stmt and teardown')
+            setup = (setup or '').replace('\t', ' ' * 4)
             for (ispy3, python) in pythons:
                 stmt1 = stmt.replace('$listif3', 'list' if ispy3 else '')
                 stmt1 = stmt1.replace('\t', ' ' * 4)
-                lines = stmt1.split('\n')
-                args = ' '.join('"%s"' % line for line in lines)
-                cmd = '%s -m timeit -n %s -r %s %s %s' % (python, number, repeat, setup, args)
-                print(python)
-                if tracecmd: 
-                    print(cmd)
-                print('\t' + os.popen(cmd).read().rstrip())
+                job = dict(stmt=stmt1, setup=setup, number=number, repeat=repeat)
+                if teardown:
+                    job['teardown'] = teardown.replace('\t', ' ' * 4)
+                if scope != 'repeat' or not nogc:
+                    job.update(scope=scope, nogc=nogc)
+                if adaptive is not None:
+                    job['adaptive'] = adaptive
+                matrix.append((index, stmt, python, job))
+
+        mems = None
+        if memory:
+            mems = memorypass([python for (index, stmt, python, job) in matrix],
+                              [job for (index, stmt, python, job) in matrix], workers)
+        if interleave:
+            # One batch job per python: its stmts' repeats round-robin in one child
+            batches = [[job for (count, (index, stmt, python, job)) in enumerate(matrix)
+                        if count % len(pythons) == pos] for pos in range(len(pythons))]
+            outs = runcmds([childcmd(python) for (ispy3, python) in pythons], workers,
+                           [json.dumps({'batch': batch}) for batch in batches])
+            queues = []
+            for out in outs:
+                res = json.loads(out)
+                queues.append(iter([dict(each, version=res['version']) for each in res['results']]))
+            outputs = (json.dumps(next(queues[count % len(pythons)])) for count in range(len(matrix)))
+        else:
+            cmds = [childcmd(python) for (index, stmt, python, job) in matrix]
+            jobs = [json.dumps(job) for (index, stmt, python, job) in matrix]
+            outputs = runcmds(cmds, workers, jobs)
+        last = None
+        for (count, ((index, stmt, python, job), out)) in enumerate(zip(matrix, outputs)):
+            if index != last:
+                print('-' * 80)
+                print('[%r]' % stmt)
+                last = index
+            print(python)
+            if tracecmd: 
+                print('%s <<< %s' % (childcmd(python), json.dumps(job)))
+            res = json.loads(out)
+            rec = record(python, res['version'], job['stmt'], job['setup'],
+                         res.get('number', job['number']), len(res['times']), res['times'], stmt)
+            if mems:
+                rec.update((key, mems[count][key]) for key in ('peak', 'blocks', 'maxrss'))
+            records.append(rec)
+            plains.append(True)
+            print('\t%.4f (median %.4f, stdev %.4f) [%s loops, %s repeats]%s' %
+                  (rec['min'], rec['median'], rec['stdev'], rec['number'], rec['repeat'],
+                   showmemory(rec)))
+
+    if profile:                                         # Separate pass: timings stay clean
+        chosen = [rec for (rec, isplain) in zip(records, plains) if isplain]
+        jobs = [dict(stmt=rec['stmt'], setup=rec['setup'], number=rec['number'])
+                for rec in chosen]
+        for name in profilepass([rec['python'] for rec in chosen], jobs, profile,
+                                profiledir, workers):
+            print('profile: %s' % name)
 
+    if output:
+        writerecords(records, output)
+    return records
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#-------------------------------------------------------
+# Usage: PYBENCH_TOKEN=secret python3 pybench_agent.py [HOST:PORT | /path/to/socket] [-public]
+# Description: benchmark agent serving pybench jobs over a socket
+#-------------------------------------------------------
+
+
+
+'''
+pybench_agent.py: a benchmark agent, so pybench can time Pythons that
+live on other hosts or in containers instead of only local executables.
+The agent listens on a TCP address (HOST:PORT, default localhost:8750;
+port 0 picks a free one) or a Unix socket path, and runs every job it
+gets with its own interpreter through pybench_child.runjob -- the same
+job dicts the spawned harness reads, so plain, adaptive, batch, memory
+and profile jobs all work (profile files land on the agent's host).
+The protocol is JSON Lines: the client sends one {"jobs": [job, ...]}
+line, and the agent streams back one {"index": i, "result": {...}} line
+per job as each finishes (or {"index": i, "error": text}), then a last
+{"done": count, "version": sys.version} line, and closes. Clients are
+served one at a time, so jobs sent to one agent never overlap in time.
+In a runner's pythons list an agent is written 'agent:HOST:PORT' or
+'agent:/path/to/socket'; pybench.runcmds hands such entries to fanout()
+here, which sends each agent its whole share of the jobs as one batch,
+all agents in parallel, while local pythons are spawned as before.
+
+An agent runs whatever code its jobs hold, so every request must prove
+it knows a shared secret: the token in the PYBENCH_TOKEN environment
+variable, set the same on the agent and on its clients (the agent won't
+start without one). The client sends {"body": text, "mac": hex}, where
+text is the JSON request plus a random nonce and the time, and mac is
+HMAC-SHA256 of text under the token; the agent drops requests whose mac
+doesn't match, that are more than maxskew seconds old, or whose nonce it
+has seen, so a captured request can't be replayed. Nothing is encrypted.
+The agent also refuses to listen on anything but a loopback address
+unless run with -public (serve(public=True)).
+Runs on both 2.X and 3.X.
+'''
+
+
+import sys, os, json, time, hmac, hashlib, binascii, socket, threading, traceback, pybench_child
+try:
+    import socketserver                                 # 3.X
+except ImportError:
+    import SocketServer as socketserver                 # 2.X
+
+
+defaddress = 'localhost:8750'
+scheme = 'agent:'
+tokenvar = 'PYBENCH_TOKEN'
+maxskew = 300                                           # Seconds a request stays valid
+
+
+
+def isagent(python):
+    return python.startswith(scheme)
+
+
+def parseaddress(address):
+    '''
+    'HOST:PORT' => (AF_INET, (host, port)); anything else is a Unix socket path.
+    '''
+    if isagent(address):
+        address = address[len(scheme):]
+    (host, sep, port) = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        return (socket.AF_INET, (host or 'localhost', int(port)))
+    return (socket.AF_UNIX, address)
+
+
+def gettoken(token=None):
+    token = token or os.environ.get(tokenvar)
+    if not token:
+        raise ValueError('no agent token: set %s on the agent and its clients' % tokenvar)
+    return token.encode('utf-8')
+
+
+def sign(token, body):
+    return hmac.new(token, body.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def seal(token, request):
+    '''
+    The signed line to send for request, a dict, with a fresh nonce.
+    '''
+    request = dict(request, nonce=binascii.hexlify(os.urandom(16)).decode('ascii'),
+                   time=time.time())
+    body = json.dumps(request)
+    return json.dumps({'body': body, 'mac': sign(token, body)}) + '\n'
+
+
+def unseal(token, line, seen):
+    '''
+    The request dict in a signed line, or None if its mac is wrong, it
+    is stale, or its nonce is in seen (nonce => time; pruned here).
+    '''
+    try:
+        sealed = json.loads(line.decode('utf-8'))
+        (body, mac) = (sealed['body'], sealed['mac'])
+        if not hmac.compare_digest(sign(token, body), str(mac)):
+            return None
+        request = json.loads(body)
+        (nonce, sent) = (request['nonce'], request['time'])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+    now = time.time()
+    for (old, when) in list(seen.items()):
+        if now - when > maxskew:
+            del seen[old]
+    if abs(now - sent) > maxskew or nonce in seen:
+        return None
+    seen[nonce] = sent
+    return request
+
+
+def isloopback(host):
+    try:
+        return socket.gethostbyname(host).startswith('127.')
+    except socket.error:
+        return False
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            request = unseal(self.server.token, line, self.server.seen)
+            if request is None:
+                self.send({'error': 'request refused: bad or missing token'})
+                return
+            jobs = request.get('jobs', [])
+            for (index, job) in enumerate(jobs):
+                try:
+                    reply = {'index': index, 'result': pybench_child.runjob(job)}
+                except Exception:
+                    reply = {'index': index, 'error': traceback.format_exc()}
+                self.send(reply)
+            self.send({'done': len(jobs), 'version': sys.version})
+
+    def send(self, reply):
+        self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+
+class TCPServer(socketserver.TCPServer):
+    allow_reuse_address = True
+
+
+def serve(address=defaddress, ready=None, token=None, public=False):
+    '''
+    Serve jobs on address forever; ready(address) is called once listening.
+    token defaults to $PYBENCH_TOKEN; a TCP address that isn't loopback
+    needs public=True.
+    '''
+    token = gettoken(token)
+    (family, where) = parseaddress(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(where):
+            os.remove(where)                            # Stale socket file
+        server = socketserver.UnixStreamServer(where, Handler)
+    else:
+        if not public and not isloopback(where[0]):
+            raise ValueError('%s is not a loopback address: pass -public to serve on it'
+                             % where[0])
+        server = TCPServer(where, Handler)
+        where = '%s:%d' % server.server_address[:2]
+    (server.token, server.seen) = (token, {})
+    if ready:
+        ready(where)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def request(address, jobs, token=None):
+    '''
+    Send jobs to the agent at address, signed with token (default
+    $PYBENCH_TOKEN); yields its reply dicts as they stream in, ending
+    with the {"done"} one.
+    '''
+    line = seal(gettoken(token), {'jobs': jobs})
+    (family, where) = parseaddress(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.connect(where)
+    try:
+        sock.sendall(line.encode('utf-8'))
+        file = sock.makefile('rb')
+        for line in file:
+            reply = json.loads(line.decode('utf-8'))
+            if 'error' in reply and 'index' not in reply:
+                raise RuntimeError('%s: %s' % (address, reply['error']))
+            yield reply
+            if 'done' in reply:
+                break
+        file.close()
+    finally:
+        sock.close()
+
+
+def version(address):
+    '''
+    The agent's sys.version: an empty batch's {"done"} reply carries it.
+    '''
+    return list(request(address, []))[-1]['version']
+
+
+def agentpythons(addresses):
+    '''
+    Runner pythons entries, [(ispy3?, 'agent:ADDRESS')], for agent addresses.
+    '''
+    return [(int(version(address)[0] == '3'), scheme + address) for address in addresses]
+
+
+def fanout(agents, inputs):
+    '''
+    Run the JSON job texts in inputs, each on the agent at the same
+    position in agents: one batch per distinct agent, all agents at once
+    on their own threads. Returns get(position), which waits for that
+    job's result and returns it as JSON text, as a spawned child would.
+    '''
+    outputs = [None] * len(agents)
+    arrived = [threading.Event() for agent in agents]
+    shares = {}
+    for (position, agent) in enumerate(agents):
+        shares.setdefault(agent, []).append(position)
+
+    def drive(agent, positions):
+        try:
+            for reply in request(agent, [json.loads(inputs[pos]) for pos in positions]):
+                if 'index' in reply:
+                    pos = positions[reply['index']]
+                    outputs[pos] = reply
+                    arrived[pos].set()
+        except Exception as exc:                        # Unreachable agent, dropped link
+            for pos in positions:
+                if outputs[pos] is None:
+                    outputs[pos] = {'error': '%s: %s' % (type(exc).__name__, exc)}
+        for pos in positions:
+            if outputs[pos] is None:
+                outputs[pos] = {'error': 'no reply'}
+            arrived[pos].set()
+
+    for (agent, positions) in shares.items():
+        thread = threading.Thread(target=drive, args=(agent, positions))
+        thread.daemon = True
+        thread.start()
+
+    def get(position):
+        arrived[position].wait()
+        reply = outputs[position]
+        if 'error' in reply:
+            raise RuntimeError('%s: %s' % (agents[position], reply['error']))
+        return json.dumps(reply['result'])
+    return get
+
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if arg != '-public']
+    address = args[0] if args else defaddress
+
+    def ready(where):
+        print('pybench agent %s listening on %s' % (sys.version.split()[0], where))
+        sys.stdout.flush()
+    try:
+        serve(address, ready, public='-public' in sys.argv)
+    except ValueError as exc:
+        sys.exit('pybench_agent: %s' % exc)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#-------------------------------------------------------
+# Usage: python3 pybench_baseline.py save NAME results.jsonl
+#        python3 pybench_baseline.py compare NAME results.jsonl [-threshold 0.05]
+# Description: named baselines and a regression gate for pybench records
+#-------------------------------------------------------
+
+
+
+'''
+pybench_baseline.py: save a pybench/pybench2 run (its list of records)
+as a named baseline on disk, and later compare a new run against it.
+Records are matched by (python, setup, stmt); for each pair the ratio
+of median per-loop times (new / baseline, so >1 is slower) is reported
+with a bootstrap confidence interval over the raw repeats and a
+Mann-Whitney U test p-value. A stmt regresses when its ratio exceeds
+1 + threshold and the whole interval lies above 1, so noise alone can't
+fail the gate; gate() returns 1 in that case, for use as an exit status.
+Stmts only in the baseline, or only in the new run, are listed too, and
+a baselined stmt missing from the run fails the gate as well: a gate
+that compared nothing must not pass.
+Baselines are JSON Lines files in the baselines directory next to this
+file, one per name.
+'''
+
+
+import sys, os, random
+from pybench import writerecords, readrecords
+
+
+basedir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+defthreshold, defconfidence, defresamples = 0.05, 0.95, 2000
+
+
+
+def basefile(name, dirname=None):
+    return os.path.join(dirname or basedir, name + '.jsonl')
+
+
+def save(records, name, dirname=None):
+    '''
+    Store a run's records as baseline name, replacing any older one.
+    '''
+    dirname = dirname or basedir
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    writerecords(records, basefile(name, dirname))
+    return basefile(name, dirname)
+
+
+def load(name, dirname=None):
+    return readrecords(basefile(name, dirname))
+
+
+def perloop(rec):
+    return [t / rec['number'] for t in rec['times']]        # number may differ
+
+
+def median(values):
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[mid]
+    return (ordered[mid - 1] + ordered[mid]) / 2.0
+
+
+def bootstrap(base, new, confidence=defconfidence, resamples=defresamples, seed=0):
+    '''
+    Confidence interval of median(new) / median(base), by resampling
+    both sets of repeats with replacement.
+    '''
+    rand = random.Random(seed)                              # Repeatable reports
+    ratios = []
+    for i in range(resamples):
+        b = median([rand.choice(base) for x in base])
+        n = median([rand.choice(new) for x in new])
+        ratios.append(n / b)
+    ratios.sort()
+    tail = (1 - confidence) / 2
+    return (ratios[int(tail * (resamples - 1))],
+            ratios[int((1 - tail) * (resamples - 1))])
+
+
+def mannwhitney(base, new):
+    '''
+    Two-sided Mann-Whitney U test, by normal approximation; returns
+    (U of new, p-value). Tied values get their average rank.
+    '''
+    import math
+    pooled = sorted([(v, 0) for v in base] + [(v, 1) for v in new])
+    ranks = [0.0] * len(pooled)
+    i = 0
+    while i < len(pooled):
+        j = i
+        while j + 1 < len(pooled) and pooled[j + 1][0] == pooled[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2.0 + 1
+        i = j + 1
+    n1, n2 = len(base), len(new)
+    rnew = sum(r for (r, (v, side)) in zip(ranks, pooled) if side == 1)
+    u = rnew - n2 * (n2 + 1) / 2.0
+    mean = n1 * n2 / 2.0
+    sd = math.sqrt(n1 * n2 * (n1 + n2 + 1) / 12.0)
+    if sd == 0:
+        return (u, 1.0)
+    z = (abs(u - mean) - 0.5) / sd                          # Continuity correction
+    return (u, min(1.0, math.erfc(max(z, 0) / math.sqrt(2))))
+
+
+def keyof(rec):
+    return (rec['python'], rec['setup'], rec['stmt'])
+
+
+def unmatched(baseline, records):
+    '''
+    Keys only in baseline (missing from the run) and only in records
+    (extra, not baselined), each as a sorted list.
+    '''
+    (olds, news) = (set(map(keyof, baseline)), set(map(keyof, records)))
+    return (sorted(olds - news), sorted(news - olds))
+
+
+def compare(baseline, records, threshold=defthreshold, confidence=defconfidence):
+    '''
+    Compare records with baseline records, returning one dict per stmt
+    found in both: key, ratio, low, high, p, and verdict, which is one
+    of 'slower' (a regression), 'faster', or 'same'. See unmatched()
+    for the rest.
+    '''
+    olds = dict((keyof(rec), rec) for rec in baseline)
+    results = []
+    for rec in records:
+        old = olds.get(keyof(rec))
+        if old is None:
+            continue
+        base, new = perloop(old), perloop(rec)
+        ratio = median(new) / median(base)
+        (low, high) = bootstrap(base, new, confidence)
+        (u, p) = mannwhitney(base, new)
+        if ratio > 1 + threshold and low > 1:
+            verdict = 'slower'
+        elif ratio < 1 / (1 + threshold) and high < 1:
+            verdict = 'faster'
+        else:
+            verdict = 'same'
+        results.append(dict(key=keyof(rec), ratio=ratio, low=low, high=high,
+                            p=p, verdict=verdict))
+    return results
+
+
+def report(results, confidence=defconfidence):
+    print('%-48s %7s  %-17s %6s  %s' % ('stmt', 'new/old', '%d%% interval' % (confidence * 100),
+                                         'p', 'verdict'))
+    for res in results:
+        (python, setup, stmt) = res['key']
+        print('%-48.48r %6.3fx  [%6.3f, %6.3f] %6.3f  %s' %
+              (stmt, res['ratio'], res['low'], res['high'], res['p'], res['verdict']))
+
+
+def gate(records, name, threshold=defthreshold, dirname=None):
+    '''
+    Compare a run with baseline name, print the report, and return an
+    exit status: 1 if any stmt regressed beyond threshold or any stmt
+    in the baseline is missing from the run, else 0.
+    '''
+    baseline = load(name, dirname)
+    results = compare(baseline, records, threshold)
+    report(results)
+    (missing, extra) = unmatched(baseline, records)
+    for (label, keys) in (('missing from this run', missing), ('not in the baseline', extra)):
+        for (python, setup, stmt) in keys:
+            print('%-48.48r %s (%s)' % (stmt, label, python))
+    status = 0
+    regressed = [res for res in results if res['verdict'] == 'slower']
+    if regressed:
+        print('%d stmt(s) regressed by more than %.0f%%' % (len(regressed), threshold * 100))
+        status = 1
+    if missing:
+        print('%d baselined stmt(s) not run: nothing to compare them with' % len(missing))
+        status = 1
+    return status
+
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4 or sys.argv[1] not in ('save', 'compare'):
+        print('Usage: pybench_baseline.py save|compare NAME results.jsonl [-threshold F]')
+        sys.exit(2)
+    (mode, name, filename) = sys.argv[1:4]
+    records = readrecords(filename)
+    if mode == 'save':
+        print('saved %s' % save(records, name))
+    else:
+        threshold = defthreshold
+        if '-threshold' in sys.argv:
+            threshold = float(sys.argv[sys.argv.index('-threshold') + 1])
+        sys.exit(gate(records, name, threshold))
@@ -3,7 +3,7 @@
 
 
 #-------------------------------------------------------
-# Usage: python3 pybench_cases.py [-a] or python2 pybench_cases.py [-a]
+# Usage: python3 pybench_cases.py [-a] [-t] [-j N] [-o file] [-b|-c NAME [-threshold F]] [-auto] [--profile cprofile|sample] [-agent HOST:PORT]... [-r] [-html F] or python2 pybench_cases.py [-a]
 # Description: test cases for timeit module
 #-------------------------------------------------------
 
@@ -14,11 +14,27 @@ pybench_cases.py: Run pybench on a set of pythons and statements.
 Select modes by editing this script or using command-line arguments (in
 sys.argv): e.g., run a "C:\python27\python pybench_cases.py" to test just
 one specific version on stmts, "pybench_cases.py -a" to test all pythons
-listed, or a "py −3 pybench_cases.py -a -t" to trace command lines too.
+listed, or a "py −3 pybench_cases.py -a -t" to trace command lines too;
+add "-j 4" to run the -a command lines on 4 CPU-pinned workers at once,
+and "-o res.jsonl" or "-o res.csv" to also save the structured records.
+"-b NAME" saves the run as a named baseline, and "-c NAME" compares the
+run with that baseline, exiting with status 1 if any stmt regressed by
+more than "-threshold F" (default 0.05, 5%) or a baselined stmt is missing.
+"-auto" ignores the (number, repeat) counts below and calibrates both
+per stmt instead (see pybench_child.adaptive), and "--profile sample"
+(or cprofile) writes flamegraph stack files for each stmt to profiles/.
+"-agent HOST:PORT" (repeatable, or "-agent /path/to/socket") also times
+the Python of a running pybench_agent, on this or another host (set
+PYBENCH_TOKEN to the agent's token).
+"-r" prints a bar chart of each stmt's times relative to the first
+python, with error bars, and "-html report.html" writes the same as a
+sortable table (see pybench_report; it also reads saved -o files).
+bench_stmts is a python3 -m bench case by its name alone: no bench
+import, so 2.X can still run this script.
 '''
 
 
-import sys, pybench
+import sys, pybench, pybench_baseline, pybench_report
 
 
 
@@ -37,9 +53,37 @@ stmts = [                                                   # (number, repeat, s
         ]
 
 
-tracecmd = '-t' in sys.argv                                 # -t: trace command lines?
-pythons = pythons if '-a' in sys.argv else None             # -a: all in list, else one?
-pybench.runner(stmts, pythons, tracecmd)
+def bench_stmts():                                          # python3 -m bench: this python, API mode
+    return pybench.runner(stmts)
+
+bench_stmts.tags = ['pybench', 'iteration', 'strings']
+
+
+
+if __name__ == '__main__':
+    tracecmd = '-t' in sys.argv                                 # -t: trace command lines?
+    pythons = pythons if '-a' in sys.argv else None             # -a: all in list, else one?
+    agents = [sys.argv[i + 1] for (i, arg) in enumerate(sys.argv) if arg == '-agent']
+    if agents:                                                   # -agent ADDR: remote pythons too
+        import pybench_agent
+        pythons = (pythons or []) + pybench_agent.agentpythons(agents)
+    workers = int(sys.argv[sys.argv.index('-j') + 1]) if '-j' in sys.argv else None   # -j N: N at once
+    output = sys.argv[sys.argv.index('-o') + 1] if '-o' in sys.argv else None         # -o F: save records
+    adaptive = True if '-auto' in sys.argv else None                                 # -auto: calibrate
+    profile = sys.argv[sys.argv.index('--profile') + 1] if '--profile' in sys.argv else None
+    records = pybench.runner(stmts, pythons, tracecmd, workers, output, adaptive, profile)
+    if '-r' in sys.argv:                                        # -r: ratio bar chart
+        pybench_report.report(records)
+    if '-html' in sys.argv:                                     # -html F: sortable table
+        pybench_report.html(records, sys.argv[sys.argv.index('-html') + 1])
+
+    if '-b' in sys.argv:                                        # -b NAME: save as baseline
+        pybench_baseline.save(records, sys.argv[sys.argv.index('-b') + 1])
+    if '-c' in sys.argv:                                        # -c NAME: regression gate
+        threshold = pybench_baseline.defthreshold
+        if '-threshold' in sys.argv:
+            threshold = float(sys.argv[sys.argv.index('-threshold') + 1])
+        sys.exit(pybench_baseline.gate(records, sys.argv[sys.argv.index('-c') + 1], threshold))
 
 
 
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#-------------------------------------------------------
+# Usage: echo '{"stmt": "x = 1"}' | python3 pybench_child.py
+# Description: timing harness run inside spawned pythons
+#-------------------------------------------------------
+
+
+
+'''
+pybench_child.py: the small harness pybench and pybench2 spawn in each
+tested Python instead of "python -m timeit". Reads one job as a JSON
+object on stdin -- {"stmt", "setup", "number", "repeat"} -- runs it with
+this Python's own timeit.repeat, and writes a JSON object with this
+Python's version and every repeat's raw total time on stdout, so the
+runner never parses "usec per loop" text. Passing the job on stdin also
+avoids all shell quoting of stmt and setup. Runs on both 2.X and 3.X.
+A job with an "adaptive" option dict ignores number and repeat: it
+first picks number so one repeat takes about target seconds (as
+timeit.Timer.autorange does, by 1-2-5 steps), then keeps adding repeats
+until the relative standard error of the mean is below rse or budget
+seconds are used; the runner's API mode calls adaptive() here too.
+A job with "memory" set runs no timing at all: it runs setup, then the
+stmt once under tracemalloc, and returns the stmt's peak traced bytes,
+the memory blocks still held afterwards by names it bound, and this
+process's max RSS in KB (None for any this Python can't measure).
+A job with "profile" set to 'cprofile' or 'sample' also runs no timing:
+it profiles number runs of the stmt with pybench_profile, writing files
+named by the job's "base" path, and returns their names.
+Jobs may also carry teardown (a string), scope ('repeat' or 'loop': run
+setup and teardown around each repeat, or around every stmt run while
+timing the stmt alone) and nogc (false keeps GC on while timing); the
+runner's API mode also passes callables for setup and teardown here. A
+"batch" job holds a list of jobs whose repeats are interleaved.
+A job's "cpu", set by the runner's worker pool, pins this process to
+that CPU before anything runs, where os.sched_setaffinity exists.
+'''
+
+
+import sys, os, json, timeit, gc
+
+
+deftarget, defrse, defbudget = 0.2, 0.01, 10.0
+
+
+
+def fixture(setup):
+    '''
+    Fresh namespace for one repeat or loop: run a setup string in a new
+    dict, or call a setup callable and use the dict it returns, if any.
+    '''
+    if callable(setup):
+        namespace = setup()
+        return namespace if isinstance(namespace, dict) else {}
+    namespace = {}
+    exec(compile(setup or 'pass', '<setup>', 'exec'), namespace)
+    return namespace
+
+
+def cleanup(teardown, namespace):
+    if callable(teardown):
+        teardown(namespace)
+    elif teardown:
+        exec(compile(teardown, '<teardown>', 'exec'), namespace)
+
+
+def maketimer(stmt, setup='pass', teardown=None, scope='repeat', nogc=True):
+    '''
+    Return run(number) => seconds for number runs of stmt.
+    setup/teardown: strings, or callables -- setup() may return the dict
+    stmt runs in, and teardown(namespace) gets that dict back
+    scope: 'repeat' runs setup/teardown around each run(), 'loop' around
+    every single stmt run, timing only the stmt itself
+    nogc: False leaves garbage collection on while timing
+    Plain string setups per repeat use timeit.Timer itself, as before.
+    '''
+    if scope == 'repeat' and not teardown and not callable(setup) and not callable(stmt):
+        if not nogc:
+            setup = 'import gc\ngc.enable()\n' + (setup or 'pass')
+        return timeit.Timer(stmt=stmt, setup=setup or 'pass').timeit
+
+    extra = {}
+    if callable(stmt):
+        (stmt, extra) = ('_pybench_stmt()', {'_pybench_stmt': stmt})
+    lines = '\n'.join(' ' * 8 + line for line in stmt.replace('\t', ' ' * 4).split('\n'))
+    code = compile('def _pybench_run(_n):\n    for _i in range(_n):\n%s\n' % lines,
+                   '<stmt>', 'exec')
+    clock = timeit.default_timer
+
+    def prepare():
+        namespace = fixture(setup)
+        namespace.update(extra)
+        exec(code, namespace)
+        return namespace
+
+    def run(number):
+        enabled = gc.isenabled()
+        if nogc:
+            gc.disable()
+        try:
+            elapsed = 0.0
+            for i in range(number if scope == 'loop' else 1):
+                namespace = prepare()
+                start = clock()
+                namespace['_pybench_run'](1 if scope == 'loop' else number)
+                elapsed += clock() - start
+                cleanup(teardown, namespace)
+        finally:
+            if enabled:
+                gc.enable()
+        return elapsed
+    return run
+
+
+def interleaved(runs, numbers, repeats):
+    '''
+    Round-robin repeats over competing stmts' run functions, so all see
+    the same machine conditions; returns one list of times per run.
+    '''
+    times = [[] for run in runs]
+    for rep in range(max(repeats)):
+        for (index, run) in enumerate(runs):
+            if rep < repeats[index]:
+                times[index].append(run(numbers[index]))
+    return times
+
+
+def calibrate(run, target=deftarget):
+    '''
+    Smallest number in 1, 2, 5, 10, 20, 50... whose total time reaches
+    target seconds; returns (number, that time).
+    '''
+    number = 1
+    while True:
+        for scale in (1, 2, 5):
+            elapsed = run(number * scale)
+            if elapsed >= target:
+                return (number * scale, elapsed)
+        number *= 10
+
+
+def relerr(times):
+    '''
+    Relative standard error of the mean of times.
+    '''
+    count = len(times)
+    mean = sum(times) / float(count)
+    var = sum((t - mean) ** 2 for t in times) / (count - 1)
+    return (var / count) ** 0.5 / mean
+
+
+def adaptive(stmt, setup='pass', target=deftarget, rse=defrse, budget=defbudget,
+             minrep=3, maxrep=1000, teardown=None, scope='repeat', nogc=True):
+    '''
+    Calibrate number, then repeat until the relative standard error is
+    at most rse, budget seconds pass, or maxrep repeats are taken.
+    Returns (number, [repeat times]); calibration runs are not kept.
+    '''
+    run = maketimer(stmt, setup, teardown, scope, nogc)
+    start = timeit.default_timer()
+    (number, first) = calibrate(run, target)
+    times = []
+    while len(times) < maxrep:
+        times.append(run(number))
+        if len(times) >= minrep and relerr(times) <= rse:
+            break
+        if timeit.default_timer() - start >= budget and len(times) >= 2:
+            break
+    return (number, times)
+
+
+def maxrss():
+    '''
+    This process's peak resident set size in KB, or None.
+    '''
+    try:
+        import resource
+    except ImportError:                                 # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss   # Bytes on macOS
+
+
+def memory(stmt, setup='pass'):
+    '''
+    Run stmt once after setup under tracemalloc; returns a dict of peak
+    (bytes above the starting level), blocks (net blocks left allocated
+    in the stmt's namespace), and maxrss (KB, whole process).
+    '''
+    try:
+        import tracemalloc                              # 3.4+
+    except ImportError:
+        return {'peak': None, 'blocks': None, 'maxrss': maxrss()}
+    namespace = {}
+    exec(compile(setup or 'pass', '<setup>', 'exec'), namespace)
+    code = compile(stmt, '<stmt>', 'exec')
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    if hasattr(tracemalloc, 'reset_peak'):              # 3.9+
+        tracemalloc.reset_peak()
+    start = tracemalloc.get_traced_memory()[0]
+    exec(code, namespace)
+    peak = tracemalloc.get_traced_memory()[1]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+    return {'peak': peak - start, 'blocks': blocks, 'maxrss': maxrss()}
+
+
+def runjob(job):
+    '''
+    Run one job dict, return the result dict sent back to the runner.
+    '''
+    if job.get('profile'):
+        import pybench_profile                          # Lives next to this file
+        files = pybench_profile.profile(job['profile'], job['stmt'], job.get('setup'),
+                                        job.get('number', 1000), job['base'])
+        return {'version': sys.version, 'files': files}
+    if job.get('memory'):
+        res = memory(job['stmt'], job.get('setup'))
+        res['version'] = sys.version
+        return res
+    if job.get('batch'):
+        jobs = job['batch']
+        runs = [maketimer(one['stmt'], one.get('setup'), one.get('teardown'),
+                          one.get('scope', 'repeat'), one.get('nogc', True)) for one in jobs]
+        times = interleaved(runs, [one.get('number', 1000) for one in jobs],
+                            [one.get('repeat', 5) for one in jobs])
+        return {'version': sys.version, 'results': [{'times': each} for each in times]}
+    options = dict(teardown=job.get('teardown'), scope=job.get('scope', 'repeat'),
+                   nogc=job.get('nogc', True))
+    if job.get('adaptive') is not None:
+        options.update((str(key), val) for (key, val) in job['adaptive'].items())
+        (number, times) = adaptive(job['stmt'], job.get('setup'), **options)
+        return {'version': sys.version, 'number': number, 'times': times}
+    run = maketimer(job['stmt'], job.get('setup'), **options)
+    times = [run(job.get('number', 1000)) for rep in range(job.get('repeat', 5))]
+    return {'version': sys.version, 'times': times}
+
+
+if __name__ == '__main__':
+    job = json.loads(sys.stdin.read())
+    if job.get('cpu') is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, set([job['cpu']]))      # Pinned by the runner's pool
+    sys.stdout.write(json.dumps(runjob(job)) + '\n')
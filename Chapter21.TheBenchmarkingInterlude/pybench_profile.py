@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#-------------------------------------------------------
+# Usage: python3 pybench_profile.py sample|cprofile STMT [SETUP]
+# Description: profile one pybench stmt, write flamegraph input
+#-------------------------------------------------------
+
+
+
+'''
+pybench_profile.py: profile a pybench stmt loop, apart from any timing.
+Two modes:
+- 'cprofile' runs the loop under cProfile, dumps the .prof stats file,
+  and also folds the caller/callee graph into collapsed stacks, sharing
+  each function's own time among its callers by call counts (cProfile
+  keeps no full stacks, so deep paths are an estimate);
+- 'sample' runs the loop plainly while a thread samples the running
+  stack every interval seconds via sys._current_frames -- much lower
+  overhead, and real stacks.
+Both write a .collapsed file, one "frame;frame;frame count" line per
+stack, the input format of flamegraph.pl, speedscope and inferno.
+pybench_child runs this for profile jobs; pybench.runner's profile
+option drives it for each (stmt, python) after the timing pass.
+'''
+
+
+import sys, os, time, threading
+
+
+definterval, defdepth = 0.001, 64
+loopname = '_pybench_loop'
+
+
+
+def makeloop(stmt, setup='pass'):
+    '''
+    Run setup in a fresh namespace and build a function there that runs
+    stmt number times, as timeit does; returns the function.
+    '''
+    namespace = {}
+    exec(compile(setup or 'pass', '<setup>', 'exec'), namespace)
+    body = '\n'.join(' ' * 8 + line for line in stmt.replace('\t', ' ' * 4).split('\n'))
+    source = 'def %s(number):\n    for _i in range(number):\n%s\n' % (loopname, body)
+    exec(compile(source, '<stmt>', 'exec'), namespace)
+    return namespace[loopname]
+
+
+def label(filename, lineno, funcname):
+    return '%s:%d:%s' % (os.path.basename(filename), lineno, funcname)
+
+
+def writecollapsed(stacks, filename):
+    with open(filename, 'w') as file:
+        for (stack, count) in sorted(stacks.items()):
+            if count > 0:
+                file.write('%s %d\n' % (';'.join(stack), count))
+    return filename
+
+
+def foldstats(stats, depth=defdepth):
+    '''
+    pstats-style {func: (cc, nc, tt, ct, callers)} => {stack: usec};
+    a callee's share along a path is its share of calls from that caller.
+    '''
+    callees = {}
+    for (func, (cc, nc, tt, ct, callers)) in stats.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+    roots = [func for func in stats if func[2] == loopname]    # Not the profiler's own
+    stacks = {}
+
+    def walk(func, path, share):
+        (cc, nc, tt, ct, callers) = stats[func]
+        path = path + (label(*func),)
+        stacks[path] = stacks.get(path, 0) + int(tt * share * 1e6)
+        if len(path) >= depth:
+            return
+        for callee in callees.get(func, []):
+            if label(*callee) in path:                  # Recursion: fold into here
+                continue
+            calls = stats[callee][0] or 1               # Primitive calls
+            edge = stats[callee][4][func]               # (cc, nc, tt, ct), or a count
+            edge = edge[0] if isinstance(edge, tuple) else edge
+            walk(callee, path, share * min(1.0, float(edge) / calls))
+
+    for root in roots:
+        walk(root, (), 1.0)
+    return stacks
+
+
+def cprofile(stmt, setup='pass', number=1, base='profile'):
+    '''
+    Profile number runs of stmt under cProfile; writes base.prof and
+    base.collapsed, returns their names.
+    '''
+    import cProfile, pstats
+    loop = makeloop(stmt, setup)
+    prof = cProfile.Profile()
+    prof.runcall(loop, number)
+    prof.dump_stats(base + '.prof')
+    stats = pstats.Stats(prof).stats
+    return [base + '.prof', writecollapsed(foldstats(stats), base + '.collapsed')]
+
+
+def sample(stmt, setup='pass', number=1, base='profile', interval=definterval):
+    '''
+    Run number runs of stmt while sampling its stack; writes
+    base.collapsed with sample counts, returns its name in a list --
+    or, warning on stderr, writes nothing and returns [] if the runs
+    ended before a single sample.
+    '''
+    loop = makeloop(stmt, setup)
+    target = threading.current_thread().ident
+    stacks = {}
+    done = []
+
+    def sampler():
+        while not done:
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(label(code.co_filename, code.co_firstlineno, code.co_name))
+                if code.co_name == loopname:
+                    break
+                frame = frame.f_back
+            if stack and stack[-1].endswith(':' + loopname):
+                key = tuple(reversed(stack))
+                stacks[key] = stacks.get(key, 0) + 1
+            time.sleep(interval)
+
+    switch = getattr(sys, 'getswitchinterval', lambda: None)()     # 3.2+
+    if switch:
+        sys.setswitchinterval(min(switch, interval / 2))    # Else GIL handoffs every 5ms
+    thread = threading.Thread(target=sampler)
+    thread.daemon = True
+    thread.start()
+    try:
+        loop(number)
+    finally:
+        done.append(True)
+        thread.join()
+        if switch:
+            sys.setswitchinterval(switch)
+    if not stacks:                                      # Too quick to catch: no empty file
+        sys.stderr.write('pybench_profile: no samples of %r in %d runs, no %s.collapsed '
+                         'written; give it more runs\n' % (stmt[:40], number, os.path.basename(base)))
+        return []
+    return [writecollapsed(stacks, base + '.collapsed')]
+
+
+def profile(mode, stmt, setup='pass', number=1, base='profile'):
+    if mode == 'cprofile':
+        return cprofile(stmt, setup, number, base)
+    elif mode == 'sample':
+        return sample(stmt, setup, number, base)
+    raise ValueError('profile mode must be cprofile or sample: %r' % mode)
+
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('Usage: pybench_profile.py sample|cprofile STMT [SETUP]')
+        sys.exit(2)
+    setup = sys.argv[3] if len(sys.argv) > 3 else 'pass'
+    for name in profile(sys.argv[1], sys.argv[2], setup, 1000):
+        print(name)
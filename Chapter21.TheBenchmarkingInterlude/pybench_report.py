@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#-------------------------------------------------------
+# Usage: python3 pybench_report.py results.jsonl [-ref PYTHON] [-html report.html] [-w WIDTH]
+# Description: ASCII and sortable HTML comparison reports for pybench records
+#-------------------------------------------------------
+
+
+
+'''
+pybench_report.py: turn a multi-interpreter pybench/pybench2 run (its
+records, or a saved .jsonl/.csv file) into a comparison report, instead
+of pasting raw output under the case scripts. For each stmt and python
+it shows the median time per loop and its ratio to a reference python
+(the first one in the records unless chosen by -ref, which matches a
+python path or version by substring), with a 95% bootstrap interval of
+that ratio over both pythons' raw repeats (pybench_baseline.bootstrap)
+as the error bar. report() prints an ASCII bar chart, one bar per
+python scaled to the slowest ratio: '#' up to the interval's low end,
+'=' up to the ratio, '-' up to its high end, and '|' at the reference
+ratio 1.0 if it falls beyond the bar. html() writes one self-contained
+page whose table sorts on any column when its header is clicked.
+'''
+
+
+import sys
+from pybench import readrecords
+from pybench_baseline import perloop, median, bootstrap
+
+
+defwidth = 40
+
+
+
+def label(rec):
+    return '%s (%s)' % (rec['python'], rec['version'].split()[0])
+
+
+def source(rec):
+    '''
+    A record's stmt as written in the case script, before its python's
+    $listif3 replacement; older records without one give their stmt.
+    '''
+    return rec.get('source') or rec['stmt']
+
+
+def compare(records, reference=None):
+    '''
+    Group records by stmt (first-seen order) and python; returns
+    (labels, reference label, rows): rows are (stmt, {label: cell}),
+    and a cell is a dict of time (median seconds per loop), ratio, low
+    and high. Stmts the reference python did not run get no ratio.
+    A stmt is its source and setup, so 2.X's '(map(...))' and 3.X's
+    'list(map(...))' runs of one '$listif3(map(...))' share a row.
+    '''
+    labels, stmts, runs = [], [], {}
+    for rec in records:
+        (name, stmt) = (label(rec), (source(rec), rec['setup'] or ''))
+        if name not in labels:
+            labels.append(name)
+        if stmt not in stmts:
+            stmts.append(stmt)
+        runs[(stmt, name)] = rec
+    refname = labels[0] if labels else None
+    if reference:
+        matches = [name for name in labels if reference in name]
+        if not matches:
+            raise ValueError('no python matches reference %r' % reference)
+        refname = matches[0]
+    rows = []
+    for stmt in stmts:
+        cells = {}
+        ref = runs.get((stmt, refname))
+        for name in labels:
+            rec = runs.get((stmt, name))
+            if rec is None:
+                continue
+            cell = dict(time=median(perloop(rec)), ratio=None, low=None, high=None)
+            if ref is not None:
+                cell['ratio'] = cell['time'] / median(perloop(ref))
+                (cell['low'], cell['high']) = bootstrap(perloop(ref), perloop(rec))
+            cells[name] = cell
+        rows.append((stmt[0] if not stmt[1] else '%s  (setup: %s)' % stmt, cells))
+    return (labels, refname, rows)
+
+
+def showtime(seconds):
+    for (unit, scale) in (('sec', 1), ('msec', 1e-3), ('usec', 1e-6)):
+        if seconds >= scale:
+            return '%.3g %s' % (seconds / scale, unit)
+    return '%.3g nsec' % (seconds / 1e-9)
+
+
+def bar(cell, scale, width=defwidth):
+    '''
+    ASCII bar for one cell: '#' to low, '=' to ratio, '-' to high, '|' at 1.0.
+    '''
+    pos = lambda value: int(round(value / scale * width))
+    (low, mid, high) = (pos(cell['low']), pos(cell['ratio']), pos(cell['high']))
+    chars = list('#' * low + '=' * (mid - low) + '-' * (high - mid))
+    one = pos(1.0)
+    if one > len(chars):
+        chars += ' ' * (one - len(chars) - 1) + '|'
+    return ''.join(chars).ljust(width + 1)
+
+
+def report(records, reference=None, width=defwidth, out=None):
+    '''
+    Print the ASCII comparison: per stmt, one bar line per python.
+    '''
+    out = out or sys.stdout
+    (labels, refname, rows) = compare(records, reference)
+    out.write('reference: %s\n' % refname)
+    namewidth = max([len(name) for name in labels] + [8])
+    for (stmt, cells) in rows:
+        out.write('-' * 80 + '\n')
+        out.write('[%r]\n' % stmt)
+        ratios = [cell['high'] for cell in cells.values() if cell['ratio'] is not None]
+        scale = max(ratios + [1.0])
+        for name in labels:
+            if name not in cells:
+                continue
+            cell = cells[name]
+            if cell['ratio'] is None:
+                out.write('%-*s %s  %12s\n' % (namewidth, name, ' ' * (width + 1), showtime(cell['time'])))
+                continue
+            out.write('%-*s %s %12s  %6.2fx [%.2f, %.2f]\n' %
+                      (namewidth, name, bar(cell, scale, width), showtime(cell['time']),
+                       cell['ratio'], cell['low'], cell['high']))
+
+
+page = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>%(title)s</title>
+<style>
+body { font-family: sans-serif; }
+table { border-collapse: collapse; }
+th, td { border: 1px solid #ccc; padding: 4px 8px; text-align: right; }
+th { background: #eee; cursor: pointer; }
+td.stmt { text-align: left; font-family: monospace; white-space: pre; }
+.bar { position: relative; width: 120px; height: 10px; background: #f4f4f4; display: inline-block; }
+.bar .mid { position: absolute; height: 10px; background: #69c; }
+.bar .err { position: absolute; height: 2px; top: 4px; background: #000; }
+.bar .one { position: absolute; width: 1px; height: 10px; background: #c00; }
+</style></head><body>
+<h1>%(title)s</h1>
+<p>Median time per loop and ratio to the reference python, <b>%(reference)s</b>,
+with a 95%% bootstrap interval; click a column header to sort.</p>
+<table id="report"><thead><tr>%(head)s</tr></thead>
+<tbody>
+%(body)s
+</tbody></table>
+<script>
+document.querySelectorAll('#report th').forEach(function (th, col) {
+  th.addEventListener('click', function () {
+    var body = document.querySelector('#report tbody');
+    var rows = Array.prototype.slice.call(body.rows);
+    var up = th.dataset.order !== 'up';
+    th.dataset.order = up ? 'up' : 'down';
+    rows.sort(function (a, b) {
+      var x = a.cells[col].dataset.value, y = b.cells[col].dataset.value;
+      var nx = parseFloat(x), ny = parseFloat(y);
+      var c = (isNaN(nx) || isNaN(ny)) ? String(x).localeCompare(String(y)) : nx - ny;
+      return up ? c : -c;
+    });
+    rows.forEach(function (row) { body.appendChild(row); });
+  });
+});
+</script>
+</body></html>
+'''
+
+
+def escape(text):
+    return (text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+                .replace('"', '&quot;'))
+
+
+def htmlbar(cell, scale):
+    pct = lambda value: '%.1f%%' % (100.0 * value / scale)
+    return ('<span class="bar"><span class="mid" style="width: %s"></span>'
+            '<span class="err" style="left: %s; width: %s"></span>'
+            '<span class="one" style="left: %s"></span></span>' %
+            (pct(cell['ratio']), pct(cell['low']), pct(cell['high'] - cell['low']), pct(1.0)))
+
+
+def html(records, filename, reference=None, title='pybench comparison'):
+    '''
+    Write the comparison as a sortable HTML table to filename: per
+    python, a time column and a ratio column with its error bar.
+    '''
+    (labels, refname, rows) = compare(records, reference)
+    head = ['<th>stmt</th>']
+    for name in labels:
+        head.append('<th>%s<br>time</th><th>%s<br>ratio</th>' % (escape(name), escape(name)))
+    body = []
+    for (stmt, cells) in rows:
+        scale = max([cell['high'] for cell in cells.values() if cell['ratio'] is not None] + [1.0])
+        tds = ['<td class="stmt" data-value="%s">%s</td>' % (escape(stmt), escape(stmt))]
+        for name in labels:
+            cell = cells.get(name)
+            if cell is None:
+                tds.append('<td data-value=""></td><td data-value=""></td>')
+                continue
+            tds.append('<td data-value="%r">%s</td>' % (cell['time'], showtime(cell['time'])))
+            if cell['ratio'] is None:
+                tds.append('<td data-value=""></td>')
+            else:
+                tds.append('<td data-value="%r">%.2fx [%.2f, %.2f] %s</td>' %
+                           (cell['ratio'], cell['ratio'], cell['low'], cell['high'],
+                            htmlbar(cell, scale)))
+        body.append('<tr>%s</tr>' % ''.join(tds))
+    with open(filename, 'w') as file:
+        file.write(page % dict(title=escape(title), reference=escape(refname or ''),
+                               head=''.join(head), body='\n'.join(body)))
+    return filename
+
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: pybench_report.py results.jsonl [-ref PYTHON] [-html report.html] [-w WIDTH]')
+        sys.exit(2)
+    records = readrecords(sys.argv[1])
+    reference = sys.argv[sys.argv.index('-ref') + 1] if '-ref' in sys.argv else None
+    width = int(sys.argv[sys.argv.index('-w') + 1]) if '-w' in sys.argv else defwidth
+    report(records, reference, width)
+    if '-html' in sys.argv:
+        print('wrote %s' % html(records, sys.argv[sys.argv.index('-html') + 1], reference))
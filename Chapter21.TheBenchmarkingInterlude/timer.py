@@ -13,6 +13,8 @@
 '''
 Homegrown timing tools for function calls.
 Does total time, best-of time, and best-of-totals time
+nettotal() and netbestof() take the same arguments but run on timer4.py:
+perf_counter_ns, with the loop/call overhead removed (still in seconds).
 '''
 
 import time, sys
@@ -55,20 +57,39 @@ def bestoftotal(reps1, reps2, func, *args, **kargs):
     return bestof(reps1, total, reps2, func, *args, **kargs)
 
 
+def nettotal(reps, func, *args, **kargs):
+    '''
+    total() on timer4: perf_counter_ns, less the loop's own cost.
+    Returns (total seconds, last result)
+    '''
+    import timer4                                           # 3.7+; calibrates on first use
+    return timer4.total(func, *args, _reps=reps, **kargs)
+
+
+def netbestof(reps, func, *args, **kargs):
+    '''
+    bestof() on timer4: perf_counter_ns, less the cost of timing a call.
+    Returns (best seconds, last result)
+    '''
+    import timer4
+    return timer4.bestof(func, *args, _reps=reps, **kargs)
+
+
 
-t1 = total(1000, pow, 2, 1000)[0]                # Compare to timer0 result above
-t2 = total(1000, str.upper, 'spam')              # return (time, last call's result)
-print(t1)
-print(t2)
-#print('total time of t1 = {}' % str(t1))
-#print('total time of t2 = {}' % str(t2))
+if __name__ == '__main__':                        # Demo only when run, not on import
+    t1 = total(1000, pow, 2, 1000)[0]                # Compare to timer0 result above
+    t2 = total(1000, str.upper, 'spam')              # return (time, last call's result)
+    print(t1)
+    print(t2)
+    #print('total time of t1 = {}' % str(t1))
+    #print('total time of t2 = {}' % str(t2))
 
-tb1 = bestof(1000, str.upper, 'spam')             # 1/1000 as long as total time
-tb2 = bestof(1000, pow, 2, 1000000)[0]
-print('bestof time of tb1 = %s' % str(tb1))
-print('bestof time of tb2 = %s' % str(tb2))
+    tb1 = bestof(1000, str.upper, 'spam')             # 1/1000 as long as total time
+    tb2 = bestof(1000, pow, 2, 1000000)[0]
+    print('bestof time of tb1 = %s' % str(tb1))
+    print('bestof time of tb2 = %s' % str(tb2))
 
-tb3 = bestof(50, total, 1000, str.upper, 'spam')
-tbt2 = bestoftotal(50, 1000, str.upper, 'spam')
-print('bestof time of tb3 = %s' % str(tb3))
-print('bestoftotal time of tbt2 = %s' % str(tbt2))
+    tb3 = bestof(50, total, 1000, str.upper, 'spam')
+    tbt2 = bestoftotal(50, 1000, str.upper, 'spam')
+    print('bestof time of tb3 = %s' % str(tb3))
+    print('bestoftotal time of tbt2 = %s' % str(tbt2))
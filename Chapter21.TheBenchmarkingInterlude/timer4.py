@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#-----------------------------------------------------
+# Usage: python3 timer4.py
+# Description: overhead-corrected nanosecond timer functions
+#-----------------------------------------------------
+
+
+
+'''
+Same usage as timer2.py and timer3.py -- total(func, *args, _reps=1000),
+bestof(func, *args, _reps=5), bestoftotal(func, *args, _reps1=5,
+_reps=1000) -- and still returning (seconds, last result), but:
+- times with time.perf_counter_ns, not the coarse time.time on Linux;
+- calibrates, on first use, the cost of the timing loop itself (range
+  iteration plus a func(*args, **kargs) dispatch of the cheapest call
+  there is, bool()) and subtracts it, so results charge only the
+  function's own work;
+- takes _nogc=True to turn off garbage collection while measuring;
+- bestoftotal(func, _width=0.02) runs batches of _reps calls until the
+  95% confidence interval of the batch time is within 2% of its mean,
+  after dropping outlier batches by median absolute deviation, and
+  returns an Estimate with the interval and sample counts instead.
+Noise can still push a correction below zero; results clamp at zero.
+Call calibrate() again to re-measure after the machine settles.
+timer.py's nettotal() and netbestof() run on these functions too;
+timer.py, timer2.py and timer3.py themselves are unchanged. Note that
+timer here is perf_counter_ns, in ns. Needs 3.7+.
+'''
+
+
+import time, gc, collections
+
+
+timer = time.perf_counter_ns
+loopcost = callcost = None                              # ns, set by calibrate() on first use
+
+
+
+empty = bool                                            # bool() -> False: a near-free C call
+
+
+def runloop(func, args, kargs, reps):
+    start = timer()
+    for i in range(reps):
+        ret = func(*args, **kargs)
+    return (timer() - start, ret)
+
+
+def runonce(func, args, kargs):
+    start = timer()
+    ret = func(*args, **kargs)
+    return (timer() - start, ret)
+
+
+def measure(nogc, action, *args):
+    '''
+    Run action(*args), with garbage collection off if nogc.
+    '''
+    if not nogc or not gc.isenabled():
+        return action(*args)
+    gc.disable()
+    try:
+        return action(*args)
+    finally:
+        gc.enable()
+
+
+def calibrate(reps=100000, trials=5):
+    '''
+    Measure the per-iteration cost of runloop and the cost of one
+    runonce on the empty call, best of trials; returns both in ns.
+    '''
+    global loopcost, callcost
+    loopcost = callcost = 0
+    loopcost = min(runloop(empty, (), {}, reps)[0] for i in range(trials)) / reps
+    callcost = min(runonce(empty, (), {})[0] for i in range(reps))
+    return (loopcost, callcost)
+
+
+def total(func, *args, _reps=1000, _nogc=False, **kargs):
+    '''
+    Total time to run func() _reps times, less the loop's own cost.
+    Returns (total seconds, last result)
+    '''
+    if loopcost is None:
+        calibrate()
+    (elapsed, ret) = measure(_nogc, runloop, func, args, kargs, _reps)
+    return (max(elapsed - loopcost * _reps, 0) / 1e9, ret)
+
+
+def bestof(func, *args, _reps=5, _nogc=False, **kargs):
+    '''
+    Quickest func() among _reps runs, less the cost of timing one call.
+    Returns (best seconds, last result)
+    '''
+    if callcost is None:
+        calibrate()
+    best = None
+    for i in range(_reps):
+        (elapsed, ret) = measure(_nogc, runonce, func, args, kargs)
+        best = elapsed if best is None or elapsed < best else best
+    return (max(best - callcost, 0) / 1e9, ret)
+
+
+Estimate = collections.namedtuple('Estimate',
+                                  'time low high samples rejected result')
+
+tvalues = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+           2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+           2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+def tvalue(df):
+    '''
+    Two-sided 95% Student's t critical value for df degrees of freedom.
+    '''
+    return tvalues[df - 1] if df <= len(tvalues) else 1.960
+
+
+def median(values):
+    ordered = sorted(values)
+    mid = len(ordered) // 2
+    return ordered[mid] if len(ordered) % 2 else (ordered[mid - 1] + ordered[mid]) / 2
+
+
+def rejectmad(samples, cutoff=3.5):
+    '''
+    Drop samples whose modified z-score, 0.6745 * |x - median| / MAD,
+    exceeds cutoff; returns (kept, rejected count).
+    '''
+    mid = median(samples)
+    mad = median([abs(x - mid) for x in samples])
+    if mad == 0:
+        return (samples, 0)
+    kept = [x for x in samples if 0.6745 * abs(x - mid) / mad <= cutoff]
+    return (kept, len(samples) - len(kept))
+
+
+def interval(samples):
+    '''
+    (mean, low, high): mean and 95% confidence interval of samples.
+    '''
+    count = len(samples)
+    mean = sum(samples) / count
+    var = sum((x - mean) ** 2 for x in samples) / (count - 1)
+    half = tvalue(count - 1) * (var / count) ** 0.5
+    return (mean, mean - half, mean + half)
+
+
+def stabletotal(func, *args, _width=0.02, _reps=1000, _minbatches=5, _maxbatches=1000,
+                _budget=10.0, _nogc=False, **kargs):
+    '''
+    Run total(func, _reps) batches until the 95% confidence interval of
+    the batch time, after MAD outlier rejection, is at most _width times
+    its mean -- or _maxbatches batches or _budget seconds are used.
+    Returns Estimate(time, low, high, samples, rejected, result), with
+    times in seconds per batch of _reps calls, like bestoftotal's.
+    '''
+    start = timer()
+    samples = []
+    while True:
+        (elapsed, ret) = total(func, *args, _reps=_reps, _nogc=_nogc, **kargs)
+        samples.append(elapsed)
+        if len(samples) < _minbatches:
+            continue
+        (kept, rejected) = rejectmad(samples)
+        (mean, low, high) = interval(kept)
+        if mean > 0 and (high - low) / mean <= _width:
+            break
+        if len(samples) >= _maxbatches or (timer() - start) / 1e9 >= _budget:
+            break
+    return Estimate(mean, low, high, len(samples), rejected, ret)
+
+
+def bestoftotal(func, *args, _reps1=5, _width=None, **kargs):
+    '''
+    Best of totals: (best of _reps1 runs of (total of _reps runs of func))
+    Returns (best total seconds, last result); given _width, runs
+    stabletotal instead and returns its Estimate (_reps1 is ignored)
+    '''
+    if _width is not None:
+        return stabletotal(func, *args, _width=_width, **kargs)
+    return min((total(func, *args, **kargs) for i in range(_reps1)),
+               key=lambda result: result[0])           # Ties: never compare rets
+
+
+
+if __name__ == '__main__':
+    calibrate()
+    print('loop overhead: %.1f ns/call, single call overhead: %d ns' % (loopcost, callcost))
+    print(total(pow, 2, 1000)[0])
+    print(bestof(str.upper, 'spam', _reps=1000))
+    print(bestoftotal(str.upper, 'spam', _reps1=50, _reps=1000, _nogc=True))
+    for (func, arg, reps) in ((str.upper, 'spam', 1000), (sorted, list(range(10000, 0, -1)), 10)):
+        est = bestoftotal(func, arg, _width=0.05, _reps=reps)
+        print('%s: %.6f [%.6f, %.6f] in %d batches, %d rejected' %
+              (func.__name__, est.time, est.low, est.high, est.samples, est.rejected))
@@ -13,7 +13,7 @@
 Test the relative speed of iteration tool alternatives
 '''
 
-import sys, timer
+import sys, timer, bench
 
 
 
@@ -49,11 +49,25 @@ def gen_func():
 
 
 
-print(sys.version)
+tests = (for_loop, list_comp, map_call, gen_expr, gen_func)
 
-for test in (for_loop, list_comp, map_call, gen_expr, gen_func):
-    (bestof, (total, result)) = timer.bestoftotal(5, 1000, test)
-    print('%-9s: %.5f => [%s...%s]' % (test.__name__, bestof, result[0], result[-1]))
+
+@bench.case(tags=['iteration', 'timer'])
+def bench_iteration():
+    results = []
+    for test in tests:
+        (bestof, (total, result)) = timer.bestoftotal(5, 1000, test)
+        results.append((test.__name__, bestof))
+    return results
+
+
+
+if __name__ == '__main__':
+    print(sys.version)
+
+    for test in tests:
+        (bestof, (total, result)) = timer.bestoftotal(5, 1000, test)
+        print('%-9s: %.5f => [%s...%s]' % (test.__name__, bestof, result[0], result[-1]))
 
 '''
 The Output Results: 
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#-------------------------------------------------
+# Usage: python3 timeseqs_scaling.py [-max N] [-o curves.csv]
+# Description: iteration alternatives timed over a sweep of input sizes
+#-------------------------------------------------
+
+
+
+'''
+Test the relative speed of iteration tool alternatives at many sizes,
+not just the reps = 10000 of timeseqs.py: each of the same five coding
+alternatives (plus an array-module and, if installed, a NumPy version)
+is timed on inputs of 10, 100, ... up to 10 ** 7 items with timer4, and
+a power law time = c * n ** k is fit to each one's curve by least
+squares on log-log scale. Prints k and c per implementation and each
+size's time relative to the fastest, and writes the raw curves as CSV
+(impl, size, seconds per call) to stdout or the -o file. Reps shrink
+as sizes grow so that every point costs about the same total time.
+'''
+
+
+import sys, math, array, csv
+import timer4
+
+try:
+    import numpy
+except ImportError:                                     # Optional: skip its variant
+    numpy = None
+
+
+
+def for_loop(seq):
+    res = []
+    for x in seq:
+        res.append(abs(x))
+    return res
+
+
+def list_comp(seq):
+    return [abs(x) for x in seq]
+
+
+def map_call(seq):
+    return list(map(abs, seq))
+
+
+def gen_expr(seq):
+    return list(abs(x) for x in seq)
+
+
+def gen_func(seq):
+    def gen():
+        for x in seq:
+            yield abs(x)
+    return list(gen())
+
+
+def array_map(seq):
+    return array.array('l', map(abs, seq))
+
+
+def numpy_vec(seq):
+    return numpy.abs(seq)
+
+
+tests = [(for_loop,  list),                             # (implementation, input maker)
+         (list_comp, list),
+         (map_call,  list),
+         (gen_expr,  list),
+         (gen_func,  list),
+         (array_map, lambda items: array.array('l', items))]
+if numpy:
+    tests.append((numpy_vec, lambda items: numpy.array(items, dtype=numpy.int64)))
+
+
+
+def sweep(maxsize=10 ** 7, work=10 ** 6, reps1=3):
+    '''
+    Time every test at sizes 10, 100, ... maxsize, with work // size
+    calls per batch; returns [(name, size, seconds per call)].
+    '''
+    rows = []
+    size = 10
+    while size <= maxsize:
+        items = range(-size // 2, size - size // 2)
+        reps = max(1, work // size)
+        for (func, make) in tests:
+            data = make(items)
+            (best, result) = timer4.bestoftotal(func, data, _reps1=reps1, _reps=reps)
+            rows.append((func.__name__, size, best / reps))
+        size *= 10
+    return rows
+
+
+def fit(points):
+    '''
+    Least-squares fit of log(t) = log(c) + k * log(n); returns (k, c).
+    Points with a zero time (below timer resolution) are skipped.
+    '''
+    xy = [(math.log(n), math.log(t)) for (n, t) in points if t > 0]
+    count = len(xy)
+    mx = sum(x for (x, y) in xy) / count
+    my = sum(y for (x, y) in xy) / count
+    sxx = sum((x - mx) ** 2 for (x, y) in xy)
+    k = sum((x - mx) * (y - my) for (x, y) in xy) / sxx if sxx else 0.0
+    return (k, math.exp(my - k * mx))
+
+
+def report(rows):
+    names = [func.__name__ for (func, make) in tests]
+    print('%-10s %8s %12s' % ('impl', 'k', 'c (sec)'))
+    for name in names:
+        (k, c) = fit([(n, t) for (impl, n, t) in rows if impl == name])
+        print('%-10s %8.3f %12.3e' % (name, k, c))
+    print()
+    print('%-10s' % 'size' + ''.join('%11s' % name[:10] for name in names))
+    for size in sorted(set(n for (impl, n, t) in rows)):
+        times = dict((impl, t) for (impl, n, t) in rows if n == size)
+        fastest = min(times.values()) or 1e-12
+        print('%-10d' % size + ''.join('%10.2fx' % (times[name] / fastest) for name in names))
+
+
+def writecsv(rows, file):
+    writer = csv.writer(file)
+    writer.writerow(['impl', 'size', 'seconds'])
+    writer.writerows(rows)
+
+
+
+if __name__ == '__main__':
+    maxsize = int(sys.argv[sys.argv.index('-max') + 1]) if '-max' in sys.argv else 10 ** 7
+    print(sys.version)
+    rows = sweep(maxsize)
+    report(rows)
+    if '-o' in sys.argv:
+        with open(sys.argv[sys.argv.index('-o') + 1], 'w', newline='') as file:
+            writecsv(rows, file)
+    else:
+        print()
+        writecsv(rows, sys.stdout)
@@ -8,7 +8,7 @@
 #------------------------------------------------------------
 
 
-import sys, timer2
+import sys, timer2, bench
 
 
 reps = 10000
@@ -41,14 +41,26 @@ def gen_func():
     return list(gen())
 
 
-print(sys.version)
+tests = (for_loop, list_comp, map_call, gen_expr, gen_func)
 
-for test in (for_loop, list_comp, map_call, gen_expr, gen_func):
-    (total, result) = timer2.bestoftotal(test, _reps1=5, _reps=1000)
-    print('%-9s: %.5f => [%s...%s]' % (test.__name__, total, result[0], result[-1]))
 
+@bench.case(tags=['iteration', 'timer'])
+def bench_iteration():
+    results = []
+    for test in tests:
+        (total, result) = timer2.bestoftotal(test, _reps1=5, _reps=1000)
+        results.append((test.__name__, total))
+    return results
 
 
+
+if __name__ == '__main__':
+    print(sys.version)
+
+    for test in tests:
+        (total, result) = timer2.bestoftotal(test, _reps1=5, _reps=1000)
+        print('%-9s: %.5f => [%s...%s]' % (test.__name__, total, result[0], result[-1]))
+
 '''
 执行结果如下所示：
 3.8.6 (default, Nov  9 2020, 16:14:32) 
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#--------------------------------------------------
+# Usage: python3 personcache.py [-n N] [-items N] [-bytes N]
+# Description: bounded LRU cache in front of the persondb shelve
+#--------------------------------------------------
+
+
+
+'''
+shelve.open('persondb') unpickles again on every db[key], and a Person
+changed in memory is lost unless it's assigned back, as updatedb.py does
+with db['Sue Jones'] = sue. writeback=True keeps every record fetched,
+without bound, and pickles and rewrites all of them on close, changed
+or not.
+
+PersonCache sits in front of the shelve instead: fetched records stay
+in an LRU cache of at most maxitems records and/or maxbytes bytes (each
+record counted as the size of its pickle), and the least recently used
+ones are evicted to make room. Each cached record keeps the pickle it
+was read as; a record is dirty if it now pickles differently, so a
+giveRaise() needs no assignment back, and only dirty records are written
+when they're evicted or on flush() and close(). Clean ones are just
+dropped. Records stored with db[key] = person are always dirty.
+stats() counts hits, misses, evictions, writes and clean (records
+evicted or flushed unchanged, with no write).
+'''
+
+
+import shelve, pickle, collections
+from shelfio import getraw, putraw
+
+
+class PersonCache:
+    def __init__(self, filename='persondb', maxitems=1000, maxbytes=None,
+                 flag='c', protocol=None):
+        self.protocol = protocol or pickle.DEFAULT_PROTOCOL
+        self.shelf = shelve.open(filename, flag, self.protocol)
+        self.maxitems = maxitems                        # None: no limit
+        self.maxbytes = maxbytes
+        self.cache = collections.OrderedDict()          # key => [person, pickle read, size]
+        self.bytes = 0
+        self.counts = dict(hits=0, misses=0, evictions=0, writes=0, clean=0)
+
+    def __getitem__(self, key):
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.counts['hits'] += 1
+            self.cache.move_to_end(key)
+            return entry[0]
+        self.counts['misses'] += 1
+        data = getraw(self.shelf, key)                  # Unpickled here, once while cached
+        person = pickle.loads(data)
+        self.add(key, [person, data, len(data)])
+        return person
+
+    def __setitem__(self, key, person):
+        if key in self.cache:
+            self.drop(key)
+        size = len(pickle.dumps(person, self.protocol))
+        self.add(key, [person, None, size])             # No pickle read: dirty
+
+    def __delitem__(self, key):
+        cached = key in self.cache
+        if cached:
+            self.drop(key)
+        try:
+            del self.shelf[key]
+        except KeyError:
+            if not cached:
+                raise
+
+    def __contains__(self, key):
+        return key in self.cache or key in self.shelf
+
+    def keys(self):
+        return sorted(set(self.shelf.keys()).union(self.cache))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def add(self, key, entry):
+        self.cache[key] = entry
+        self.bytes += entry[2]
+        while len(self.cache) > 1 and (
+                (self.maxitems is not None and len(self.cache) > self.maxitems) or
+                (self.maxbytes is not None and self.bytes > self.maxbytes)):
+            (oldkey, oldentry) = self.cache.popitem(last=False)
+            self.bytes -= oldentry[2]
+            self.counts['evictions'] += 1
+            self.writeback(oldkey, oldentry)
+
+    def drop(self, key):
+        self.bytes -= self.cache.pop(key)[2]
+
+    def writeback(self, key, entry):
+        '''
+        Write entry's record if it changed since read; True if written.
+        Leaves self.bytes alone: an evicted entry's size is already off
+        it, and flush() recounts the ones still cached.
+        '''
+        data = pickle.dumps(entry[0], self.protocol)
+        if data == entry[1]:
+            self.counts['clean'] += 1
+            return False
+        putraw(self.shelf, key, data)
+        self.counts['writes'] += 1
+        (entry[1], entry[2]) = (data, len(data))        # Clean again, till changed again
+        return True
+
+    def flush(self):
+        '''
+        Write every dirty cached record, keeping all of them cached;
+        returns how many were written.
+        '''
+        written = 0
+        for (key, entry) in self.cache.items():
+            size = entry[2]
+            if self.writeback(key, entry):
+                written += 1
+                self.bytes += entry[2] - size           # Still cached: counted at its new size
+        self.shelf.sync()
+        return written
+
+    def stats(self):
+        counts = dict(self.counts, items=len(self.cache), bytes=self.bytes)
+        lookups = counts['hits'] + counts['misses']
+        counts['hitrate'] = counts['hits'] / lookups if lookups else 0.0
+        return counts
+
+    def close(self):
+        self.flush()
+        self.shelf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+
+if __name__ == '__main__':
+    import sys, os, time, random, tempfile
+    from person import Person, Manager
+
+    n = int(sys.argv[sys.argv.index('-n') + 1]) if '-n' in sys.argv else 20000
+    maxitems = int(sys.argv[sys.argv.index('-items') + 1]) if '-items' in sys.argv else 2000
+    maxbytes = int(sys.argv[sys.argv.index('-bytes') + 1]) if '-bytes' in sys.argv else None
+    filename = os.path.join(tempfile.mkdtemp(), 'persondb')
+    db = shelve.open(filename)
+    for i in range(n):
+        name = 'Person %d' % i
+        db[name] = (Manager(name, 50000) if i % 50 == 0 else
+                    Person(name, random.choice(['dev', 'ops', 'qa']), 40000))
+    db.close()
+
+    random.seed(1)                                      # Skewed: a few people are asked for most
+    lookups = ['Person %d' % min(int(random.paretovariate(0.5)) - 1, n - 1) for i in range(100000)]
+    raises = set(random.sample(range(len(lookups)), 1000))
+
+    def run(db):
+        start = time.perf_counter()
+        for (i, name) in enumerate(lookups):
+            person = db[name]
+            if i in raises:
+                person.giveRaise(.01)                   # No db[name] = person needed
+        cached = len(db.cache)
+        db.close()
+        return (time.perf_counter() - start, cached)
+
+    print('%d lookups of %d people, %d raises' % (len(lookups), len(set(lookups)), len(raises)))
+    print('writeback=True: %.3fs, %d cached at close, all rewritten'
+          % run(shelve.open(filename, writeback=True)))
+    cache = PersonCache(filename, maxitems=maxitems, maxbytes=maxbytes)
+    print('PersonCache:    %.3fs, %d cached at close' % run(cache))
+    print(cache.stats())
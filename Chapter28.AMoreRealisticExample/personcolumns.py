@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#--------------------------------------------------
+# Usage: python3 personcolumns.py [-db NAME] [-n N]
+# Description: Person records as memory-mapped columns, not pickles
+#--------------------------------------------------
+
+
+
+'''
+In the persondb shelve every Person is a pickle of its whole __dict__,
+field names included, and reading one pay means unpickling one object.
+This stores name, job and pay as columns of one file instead, opened
+with mmap:
+
+    header      magic, count, heap size, meta size (struct HEADER)
+    meta        JSON: the classes the records were, as [module, qualname]
+    pay         count int64s
+    jobpos      count int64s: where each job starts in the heap
+    nameoffs    count + 1 int64s: name i is heap[nameoffs[i]:nameoffs[i+1]]
+    joblen      count int32s: each job's length, -1 for None
+    kind        count bytes: index of each record's class in meta
+    heap        the names, then the jobs (each distinct one once), utf-8
+
+Records are sorted by name, so find(name) bisects the name column. A
+Person or Manager is made only when asked for (db[name], person(i),
+iteration), straight from its columns, without running __init__, so
+records can hold only name, job and pay. Aggregates never make one:
+payroll() sums the mapped pay column as it sits in the file, and the
+pay attribute is that column, a memoryview of int64s.
+
+The file is written whole, by write() or fromshelve(); opened with
+write=True, db[name] = person stores a changed pay and job back in
+place. A new job string is appended to the heap, growing the file.
+'''
+
+
+import os, sys, json, mmap, struct, importlib
+from array import array
+
+HEADER = '<8sQQQ'                                       # magic, count, heap size, meta size
+MAGIC = b'PERSONC1'
+
+
+def align(size):
+    return -(-size // 8) * 8
+
+
+def layout(count, metasize):
+    '''
+    {column: (offset, typecode, length)}, and where the heap starts.
+    '''
+    columns = {}
+    offset = align(struct.calcsize(HEADER) + metasize)
+    for (column, typecode, length) in (('pay', 'q', count), ('jobpos', 'q', count),
+                                       ('nameoffs', 'q', count + 1), ('joblen', 'i', count),
+                                       ('kind', 'B', count)):
+        columns[column] = (offset, typecode, length)
+        offset = align(offset + length * array(typecode).itemsize)
+    return (columns, offset)
+
+
+def write(filename, people):
+    '''
+    Write people, any iterable of Person-like objects, to filename.
+    '''
+    people = sorted(people, key=lambda person: person.name)
+    classes, kinds = [], array('B')
+    heap, jobs = bytearray(), {}
+    cols = dict(pay=array('q'), jobpos=array('q'), nameoffs=array('q', [0]), joblen=array('i'))
+    for person in people:
+        extra = set(vars(person)) - {'name', 'job', 'pay'}
+        if extra:
+            raise ValueError('%s: only name, job and pay are stored, not %s'
+                             % (person.name, ', '.join(sorted(extra))))
+        cls = [type(person).__module__, type(person).__qualname__]
+        if cls not in classes:
+            classes.append(cls)
+        kinds.append(classes.index(cls))
+        heap += person.name.encode('utf-8')             # All the names first, back to back
+        cols['nameoffs'].append(len(heap))
+    for person in people:
+        if person.job is None:
+            (pos, length) = (0, -1)
+        else:
+            job = person.job.encode('utf-8')
+            if job not in jobs:                         # Each distinct job once
+                jobs[job] = len(heap)
+                heap += job
+            (pos, length) = (jobs[job], len(job))
+        cols['jobpos'].append(pos)
+        cols['joblen'].append(length)
+        cols['pay'].append(person.pay)
+    cols['kind'] = kinds
+    meta = json.dumps(dict(classes=classes)).encode('utf-8')
+    (columns, heapstart) = layout(len(people), len(meta))
+    temp = '%s.%d.tmp' % (filename, os.getpid())
+    with open(temp, 'wb') as file:
+        file.write(struct.pack(HEADER, MAGIC, len(people), len(heap), len(meta)) + meta)
+        for (column, (offset, typecode, length)) in columns.items():
+            file.seek(offset)
+            file.write(cols[column].tobytes())
+        file.seek(heapstart)
+        file.write(heap)
+    os.replace(temp, filename)                          # Readers see old or new, never half
+
+
+def fromshelve(shelvename, filename):
+    '''
+    Write every record of a shelve, e.g. persondb, to filename.
+    '''
+    import shelve
+    db = shelve.open(shelvename, 'r')
+    try:
+        write(filename, (db[key] for key in db))
+    finally:
+        db.close()
+
+
+class PersonColumns:
+    def __init__(self, filename, write=False):
+        self.write = write
+        self.file = open(filename, 'r+b' if write else 'rb')
+        self.jobs = None                                # job bytes => heap pos, when needed
+        self.map()
+
+    def map(self):
+        access = mmap.ACCESS_WRITE if self.write else mmap.ACCESS_READ
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=access)
+        (magic, self.count, self.heapsize, self.metasize) = struct.unpack_from(HEADER, self.mm)
+        if magic != MAGIC:
+            raise ValueError('%s is not a person columns file' % self.file.name)
+        start = struct.calcsize(HEADER)
+        meta = json.loads(self.mm[start:start + self.metasize].decode('utf-8'))
+        self.classes = [getattr(importlib.import_module(module), qualname)
+                        for (module, qualname) in meta['classes']]
+        (columns, self.heapstart) = layout(self.count, self.metasize)
+        self.view = memoryview(self.mm)
+        for (column, (offset, typecode, length)) in columns.items():
+            size = length * array(typecode).itemsize
+            setattr(self, column, self.view[offset:offset + size].cast(typecode))
+
+    def unmap(self):
+        for column in ('pay', 'jobpos', 'nameoffs', 'joblen', 'kind', 'view'):
+            getattr(self, column).release()             # mmap can't close under a view
+        self.mm.close()
+
+    def __len__(self):
+        return self.count
+
+    def name(self, i):
+        heap = self.heapstart
+        return str(self.mm[heap + self.nameoffs[i]:heap + self.nameoffs[i + 1]], 'utf-8')
+
+    def job(self, i):
+        if self.joblen[i] < 0:
+            return None
+        start = self.heapstart + self.jobpos[i]
+        return str(self.mm[start:start + self.joblen[i]], 'utf-8')
+
+    def find(self, name):
+        '''
+        Position of the record named name, by bisecting the name column.
+        '''
+        (low, high) = (0, self.count)
+        while low < high:
+            mid = (low + high) // 2
+            if self.name(mid) < name:
+                low = mid + 1
+            else:
+                high = mid
+        if low == self.count or self.name(low) != name:
+            raise KeyError(name)
+        return low
+
+    def person(self, i):
+        '''
+        The Person (or Manager...) at position i, made now, from columns.
+        '''
+        cls = self.classes[self.kind[i]]
+        person = cls.__new__(cls)
+        person.__dict__.update(name=self.name(i), job=self.job(i), pay=self.pay[i])
+        return person
+
+    def __getitem__(self, name):
+        return self.person(self.find(name))
+
+    def __contains__(self, name):
+        try:
+            self.find(name)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.person(i)
+
+    def keys(self):
+        return [self.name(i) for i in range(self.count)]
+
+    def payroll(self):
+        '''
+        Total pay, summed over the mapped pay column.
+        '''
+        return sum(self.pay)
+
+    def __setitem__(self, name, person):
+        '''
+        Store person's pay and job back into record name, in place.
+        '''
+        if not self.write:
+            raise TypeError('opened read-only: PersonColumns(filename, write=True)')
+        i = self.find(name)
+        if person.job is None:
+            self.joblen[i] = -1
+        elif person.job != self.job(i):
+            (self.jobpos[i], self.joblen[i]) = self.addjob(person.job.encode('utf-8'))
+        self.pay[i] = person.pay
+
+    def addjob(self, job):
+        '''
+        Heap (pos, length) of job, appended to the heap if it's new.
+        '''
+        if self.jobs is None:
+            self.jobs = {}
+            for i in range(self.count):
+                if self.joblen[i] >= 0:
+                    self.jobs[self.job(i).encode('utf-8')] = self.jobpos[i]
+        if job not in self.jobs:
+            self.mm.flush()
+            self.unmap()
+            self.file.seek(self.heapstart + self.heapsize)
+            self.file.write(job)
+            self.jobs[job] = self.heapsize
+            self.heapsize += len(job)
+            self.file.seek(0)
+            self.file.write(struct.pack(HEADER, MAGIC, self.count, self.heapsize, self.metasize))
+            self.file.flush()
+            self.map()
+        return (self.jobs[job], len(job))
+
+    def flush(self):
+        if self.write:
+            self.mm.flush()
+
+    def close(self):
+        self.flush()
+        self.unmap()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+
+if __name__ == '__main__':
+    import time, random, shelve, tempfile
+    from person import Person, Manager
+    from shelfio import files
+
+    folder = tempfile.mkdtemp()
+    if '-db' in sys.argv:                               # An existing shelve, e.g. persondb
+        shelvename = sys.argv[sys.argv.index('-db') + 1]
+    else:
+        shelvename = os.path.join(folder, 'persondb')
+        n = int(sys.argv[sys.argv.index('-n') + 1]) if '-n' in sys.argv else 100000
+        db = shelve.open(shelvename)
+        for i in range(n):
+            name = 'Person %d' % i
+            if i % 50 == 0:
+                db[name] = Manager(name, random.randrange(50000, 150000))
+            else:
+                db[name] = Person(name, random.choice(['dev', 'ops', 'qa']),
+                                  random.randrange(30000, 120000))
+        db.close()
+    filename = os.path.join(folder, 'persondb.cols')
+
+    fromshelve(shelvename, filename)
+    sizes = sum(os.path.getsize(shelvename + suffix) for suffix in files(shelvename)
+                if shelvename + suffix != filename)    # Any dbm's files, not ours
+    print('shelve %d bytes, columns %d bytes' % (sizes, os.path.getsize(filename)))
+
+    start = time.perf_counter()
+    db = shelve.open(shelvename, 'r')
+    total = sum(db[key].pay for key in db)
+    db.close()
+    print('payroll from the shelve:  %d in %.4fs' % (total, time.perf_counter() - start))
+
+    with PersonColumns(filename, write=True) as db:
+        start = time.perf_counter()
+        payroll = db.payroll()
+        print('payroll from the columns: %d in %.4fs' % (payroll, time.perf_counter() - start))
+        assert payroll == total
+
+        name = db.name(len(db) // 2)
+        person = db[name]                               # Made now, from three columns
+        print(repr(person), person.job, type(person).__name__)
+        person.giveRaise(.10)
+        person.job = 'lead'                             # A new job: appended to the heap
+        db[name] = person
+        print(repr(db[name]), db[name].job)
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#--------------------------------------------------
+# Usage: python3 personstore.py [-db NAME] [-n N]
+# Description: persondb shelve with indexes on job, pay and lastName()
+#--------------------------------------------------
+
+
+
+'''
+A shelve can only find a record by its key, so "all devs" or "pay over
+100000" means unpickling every Person with for key in sorted(db).
+PersonStore wraps the persondb shelve and keeps secondary indexes on
+job, lastName() and pay in a second shelve beside it (NAME-index), so
+byjob(), bylastname() and bypay() unpickle only the records that match.
+
+Index entries, each a key of the index shelve:
+    job:JOB, last:LAST      list of names with that job / last name
+    pay:N                   one page of the pay index: a sorted list of
+                            (pay, name), at most page entries long
+    paydir                  (first entry of each page, page ids, next id)
+    row:NAME                (job, pay, lastName) as indexed, to find and
+                            remove a record's old entries when it changes
+Pay pages split when full and go away when empty, so a write rewrites
+one page and the small directory, not the whole pay index, and bypay()
+reads just the pages its range covers. A split writes its pieces as new
+pages, and the old page is deleted only after paydir names the new
+ones, so a crash mid-split still leaves paydir and its pages whole.
+
+dbm has no transactions, so each write goes: pending = name in the
+index, the record into the shelve, its index entries moved from the old
+row to the new one, then pending = None (not deleted: dbm.dumb rewrites
+its whole directory file on every delete). Every index step is
+idempotent, so a store reopened after a crash with pending set just
+redoes the move from the row to whatever the shelve now holds, and the
+indexes match the records again. A store opened with no index yet is
+indexed in full by reindex(); call that too after changing the records
+through a plain shelve.open(), as in updatedb.py, which the index can't
+see.
+
+update(where, change) is updatedb.py's fetch, giveRaise, assign loop for
+many people at once: one pass over the records calls change(person) on
+each one where(person) accepts and pickles it, a batch at a time, into
+a journal file; the journal is fsynced and renamed into place, which is
+the commit, and only then replayed into the shelve with each batch's
+index moves done together -- each list and pay page rewritten once per
+batch, not once per person, and no pending marks. A journal found on
+open is a committed update a crash interrupted, and is replayed again;
+one never renamed (NAME-journal.tmp) never happened.
+'''
+
+
+import os, shelve, pickle, bisect
+from shelfio import putraw, fsyncdir
+
+
+class PersonStore:
+    def __init__(self, filename='persondb', flag='c', page=512, protocol=None):
+        self.filename = filename
+        self.protocol = protocol or pickle.DEFAULT_PROTOCOL
+        self.db = shelve.open(filename, flag, self.protocol)
+        self.index = shelve.open(filename + '-index', flag)
+        self.page = page                                # Most entries per pay page
+        if 'paydir' not in self.index:                  # New, or a reindex died
+            self.reindex()
+        self.paydir = self.index['paydir']
+        crashed = False
+        if self.index.get('pending') is not None:       # A write died halfway
+            self.recover(self.index['pending'])
+            crashed = True
+        if os.path.exists(filename + '-journal'):       # An update died after its commit
+            self.replay(filename + '-journal')
+            crashed = True
+        if crashed:
+            self.dropstale()
+
+    # Mapping interface: records by name
+
+    def __getitem__(self, name):
+        return self.db[name]
+
+    def __contains__(self, name):
+        return name in self.db
+
+    def __len__(self):
+        return len(self.db)
+
+    def __iter__(self):
+        return iter(self.db)
+
+    def keys(self):
+        return self.db.keys()
+
+    def __setitem__(self, name, person):
+        self.index['pending'] = name                    # Intent first, cleared last
+        self.db[name] = person
+        self.moves([(name, self.index.get('row:' + name), self.fields(person))])
+        self.index['pending'] = None
+
+    def __delitem__(self, name):
+        row = self.index.get('row:' + name)
+        self.index['pending'] = name
+        del self.db[name]
+        self.moves([(name, row, None)])
+        self.index['pending'] = None
+
+    def store(self, person):
+        '''
+        Store person under its own name, as makedb.py does.
+        '''
+        self[person.name] = person
+
+    # Bulk updates: one pass, one commit
+
+    def update(self, where, change, names=None, batch=10000):
+        '''
+        Call change(person) for each person where(person) is true -- of
+        names, or of every record -- in one pass, and commit all the
+        changes at once; returns how many people changed. For a raise:
+        db.update(lambda p: p.job == 'dev', lambda p: p.giveRaise(.10)),
+        or pass names=db.names('job', 'dev') to visit only the devs.
+        '''
+        journal = self.filename + '-journal'
+        count = 0
+        with open(journal + '.tmp', 'wb') as file:
+            changes = []
+            for name in (self.db if names is None else names):
+                person = self.db[name]
+                if where(person):
+                    old = self.fields(person)
+                    change(person)
+                    changes.append((name, pickle.dumps(person, self.protocol),
+                                    old, self.fields(person)))
+                    if len(changes) == batch:
+                        pickle.dump(changes, file)
+                        (count, changes) = (count + len(changes), [])
+            if changes:
+                pickle.dump(changes, file)
+                count += len(changes)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(journal + '.tmp', journal)           # The commit: all or nothing
+        fsyncdir(journal)                               # ...once the rename is on disk
+        self.replay(journal)
+        return count
+
+    def replay(self, journal):
+        '''
+        Write a committed update's records and index moves, batch by
+        batch, then drop its journal. The moves start from the fields
+        each record had in the scan, not its row, saving an index read
+        per record; either way they are safe to redo after a crash.
+        '''
+        with open(journal, 'rb') as file:
+            while True:
+                try:
+                    changes = pickle.load(file)
+                except EOFError:
+                    break
+                for (name, record, old, new) in changes:    # Pickled once, in the scan
+                    putraw(self.db, name, record)
+                self.moves([(name, old, new) for (name, record, old, new) in changes])
+        self.sync()
+        os.remove(journal)
+
+    # Queries: only matching records are fetched
+
+    def names(self, field, value):
+        '''
+        Names indexed under field ('job' or 'last') == value.
+        '''
+        return list(self.index.get('%s:%r' % (field, value), []))
+
+    def byjob(self, job):
+        return [self.db[name] for name in self.names('job', job)]
+
+    def bylastname(self, last):
+        return [self.db[name] for name in self.names('last', last)]
+
+    def paynames(self, low=None, high=None):
+        '''
+        [(pay, name)] with low <= pay <= high, in pay order; None is open.
+        '''
+        (firsts, ids, nextid) = self.paydir
+        start = 0 if low is None else max(bisect.bisect_right(firsts, (low,)) - 1, 0)
+        found = []
+        for pageid in ids[start:]:
+            for (pay, name) in self.index['pay:%d' % pageid]:
+                if high is not None and pay > high:
+                    return found
+                if low is None or pay >= low:
+                    found.append((pay, name))
+        return found
+
+    def bypay(self, low=None, high=None):
+        return [self.db[name] for (pay, name) in self.paynames(low, high)]
+
+    # Index upkeep
+
+    def fields(self, person):
+        return (person.job, person.pay, person.lastName())
+
+    def moves(self, changes):
+        '''
+        Move index entries for changes, [(name, old, new)] with old and
+        new the fields indexed before and after (None: no record).
+        Only the fields that changed are touched, each list and pay page
+        is rewritten once per call, and the rows go last, so a move cut
+        short is redone from the same rows.
+        '''
+        lists, drops, adds, rows = {}, [], [], []
+        for (name, old, new) in changes:
+            if old == new:
+                continue
+            for (field, pos) in (('job', 0), ('last', 2)):
+                if old and new and old[pos] == new[pos]:
+                    continue
+                if old:
+                    lists.setdefault('%s:%r' % (field, old[pos]), (set(), set()))[1].add(name)
+                if new:
+                    lists.setdefault('%s:%r' % (field, new[pos]), (set(), set()))[0].add(name)
+            if not (old and new and old[1] == new[1]):
+                if old:
+                    drops.append((old[1], name))
+                if new:
+                    adds.append((new[1], name))
+            rows.append((name, new))
+        for (key, (added, dropped)) in lists.items():
+            names = [name for name in self.index.get(key, []) if name not in dropped]
+            names.extend(sorted(added.difference(names)))
+            if names:
+                self.index[key] = names
+            else:
+                self.index.pop(key, None)
+        if drops or adds:
+            self.paymove(drops, adds)
+        for (name, new) in rows:
+            if new:
+                self.index['row:' + name] = new
+            else:
+                self.index.pop('row:' + name, None)
+
+    def paymove(self, drops, adds):
+        '''
+        Delete pay entries drops and insert adds, (pay, name) each. Each
+        page touched is rewritten once; one grown past page entries is
+        split into even pieces, and one left empty goes. Split pieces go
+        to new pages and old pages are deleted only after paydir names
+        the new ones, so a crash before paydir leaves every page it
+        names whole, for the redo.
+        '''
+        (firsts, ids, nextid) = self.paydir
+        (firsts, ids) = (list(firsts), list(ids))       # self.paydir stays the old one till written
+        if not ids and adds:                            # First page
+            (firsts, ids, nextid) = ([min(adds)], [nextid], nextid + 1)
+        touched = {}
+        for entry in drops:
+            i = bisect.bisect_right(firsts, entry) - 1
+            if i >= 0:
+                touched.setdefault(i, (set(), set()))[0].add(entry)
+        for entry in adds:
+            i = max(bisect.bisect_right(firsts, entry) - 1, 0)
+            touched.setdefault(i, (set(), set()))[1].add(entry)
+        stale = []                                      # Pages to delete once paydir is written
+        for i in sorted(touched, reverse=True):         # Splits shift only later pages
+            (dropped, added) = touched[i]
+            page = sorted(set(self.index.get('pay:%d' % ids[i], [])) - dropped | added)
+            if not page:
+                stale.append(ids[i])
+                del firsts[i], ids[i]
+                continue
+            size = -(-len(page) // -(-len(page) // self.page))
+            pieces = [page[at:at + size] for at in range(0, len(page), size)]
+            if len(pieces) == 1:                        # In place: a redo rewrites it the same
+                self.index['pay:%d' % ids[i]] = page
+                firsts[i] = page[0]
+                continue
+            stale.append(ids[i])
+            newids = list(range(nextid, nextid + len(pieces)))
+            for (pageid, piece) in zip(newids, pieces):
+                self.index['pay:%d' % pageid] = piece
+            firsts[i:i + 1] = [piece[0] for piece in pieces]
+            ids[i:i + 1] = newids
+            nextid += len(pieces)
+        self.paydir = self.index['paydir'] = (firsts, ids, nextid)
+        for pageid in stale:
+            self.index.pop('pay:%d' % pageid, None)
+
+    def recover(self, name):
+        '''
+        Finish a write to name that a crash cut short.
+        '''
+        new = self.fields(self.db[name]) if name in self.db else None
+        self.moves([(name, self.index.get('row:' + name), new)])
+        self.index['pending'] = None
+
+    def dropstale(self):
+        '''
+        Delete pay pages paydir doesn't name: pieces of a split a crash
+        cut short, or pages a split replaced before it could delete them.
+        '''
+        live = set('pay:%d' % pageid for pageid in self.paydir[1])
+        for key in [key for key in self.index.keys() if key.startswith('pay:')]:
+            if key not in live:
+                del self.index[key]
+
+    def reindex(self):
+        '''
+        Rebuild every index from the records, in one pass over them.
+        '''
+        self.index.close()
+        self.index = shelve.open(self.filename + '-index', 'n')     # Not clear(): see above
+        self.paydir = ([], [], 0)
+        lists, pays = {}, []
+        for name in self.db:
+            row = self.fields(self.db[name])
+            self.index['row:' + name] = row
+            lists.setdefault('job:%r' % (row[0],), []).append(name)
+            lists.setdefault('last:%r' % (row[2],), []).append(name)
+            pays.append((row[1], name))
+        for key in lists:
+            self.index[key] = lists[key]
+        self.paymove([], pays)                          # Writes paydir last: marks it done
+
+    def sync(self):
+        self.db.sync()
+        self.index.sync()
+
+    def close(self):
+        self.db.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+
+if __name__ == '__main__':
+    import sys, os, time, random, tempfile
+    from person import Person, Manager
+
+    if '-db' in sys.argv:                               # An existing shelve, e.g. persondb
+        filename = sys.argv[sys.argv.index('-db') + 1]
+    else:
+        filename = os.path.join(tempfile.mkdtemp(), 'persondb')
+    n = int(sys.argv[sys.argv.index('-n') + 1]) if '-n' in sys.argv else 10000
+
+    with PersonStore(filename) as db:
+        if not len(db):
+            for obj in (Person('Bob Smith'), Person('Sue Jones', job='dev', pay=100000),
+                        Manager('Tom Jones', 50000)):
+                db.store(obj)
+            firsts = ['Ann', 'Bob', 'Cal', 'Dee', 'Eve', 'Fay', 'Gus', 'Hal']
+            lasts = ['Smith', 'Jones', 'Brown', 'Young', 'Lopez', 'Khan', 'Ito', 'Nagy']
+            for i in range(n):
+                name = '%s %s%d' % (random.choice(firsts), random.choice(lasts), i)
+                if i % 50 == 0:
+                    db.store(Manager(name, random.randrange(50000, 150000)))
+                else:
+                    db.store(Person(name, random.choice(['dev', 'ops', 'qa']),
+                                    random.randrange(30000, 120000)))
+        print('%d records in %s' % (len(db), filename))
+
+        sue = db['Sue Jones']                           # Same update as updatedb.py
+        sue.giveRaise(.10)
+        db['Sue Jones'] = sue                           # Moves only her pay entry
+
+        start = time.perf_counter()
+        for name in db.names('job', 'dev'):             # Per key: a write, and index moves, each
+            person = db[name]
+            person.giveRaise(.10)
+            db[name] = person
+        loop = time.perf_counter() - start
+        start = time.perf_counter()
+        count = db.update(lambda person: person.job == 'dev',
+                          lambda person: person.giveRaise(.10))
+        bulk = time.perf_counter() - start
+        print('raise %d devs: per key %.3fs, update %.3fs' % (count, loop, bulk))
+
+        start = time.perf_counter()
+        scanned = [db[key] for key in sorted(db) if db[key].job == 'mgr']
+        scan = time.perf_counter() - start
+        start = time.perf_counter()
+        indexed = db.byjob('mgr')
+        query = time.perf_counter() - start
+        print('job == mgr: %d found, scan %.4fs, index %.4fs' % (len(indexed), scan, query))
+        assert sorted(p.name for p in scanned) == sorted(p.name for p in indexed)
+
+        print('last name Jones:', sorted(p.name for p in db.bylastname('Jones')))
+        print('pay over 100000:', len(db.bypay(low=100001)))
+        for person in db.bypay(low=100000, high=112000)[:5]:
+            print('\t', repr(person))
@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#--------------------------------------------------
+# Usage: python3 personwal.py [-n N] [-threads N] [-maxbatch N] [-maxdelay S]
+# Description: write-ahead log with group commit in front of the persondb shelve
+#--------------------------------------------------
+
+
+
+'''
+Each db[key] = person on a shelve is its own dbm write, and none of them
+is safe on disk before db.close() -- dbm.dumb doesn't even fsync then.
+WALStore makes updates durable cheaply: db[key] = person appends the
+pickled record to a write-ahead log, NAME.wal.N, and returns once the
+log is fsynced; the shelve itself is brought up to date later, in the
+background.
+
+Group commit, leader/follower style: a thread waiting for its record
+writes and fsyncs everything buffered at once if no fsync is in flight
+(the leader); if one is, it waits (a follower), and the records put
+meanwhile go out together in the next fsync, led by one of the threads
+that waited. A lone writer pays one fsync per write, no more; threads
+writing at once share each fsync. With sync=False db[key] = person
+doesn't wait at all: a flusher thread writes such records once the
+oldest has waited maxdelay seconds or maxbatch are buffered, and
+commit() writes (and waits for) everything put so far -- for a payroll
+run of many updates and one fsync at the end.
+
+Until checkpointed, logged records are read from memory (the overlay).
+When a log reaches checkpoint bytes, a new one is started, and a
+checkpointer thread writes the records logged so far into the shelve,
+syncs and fsyncs it, and deletes the old log. Opening a store replays
+any logs left -- a crash's -- into the shelve first; each log record is
+length- and crc32-framed, so a torn last write is found and ignored.
+Creating and deleting a log fsync its folder, so a deleted log can't
+come back to replay old records over newer ones.
+
+dbm.dumb rewrites its index file, NAME.dir, in place when it syncs (and
+on every delete), so a crash then can leave it empty or cut short: the
+whole shelve lost. So before a checkpoint or a replay writes to the
+shelve, a copy of the index as last synced is made durable, NAME.wal.dir,
+and deleted once the shelve is synced again. A store opened with that
+copy left puts it back over NAME.dir before replaying the logs, which
+still hold every record written since. Replaying a record twice does no
+harm, so a crash mid-checkpoint loses nothing.
+
+A failed log write or fsync, or a failed checkpoint, is kept and raised
+again in every thread waiting, and in every write, commit() and close()
+after it: the logs stay behind, for the next open to replay.
+'''
+
+
+import os, re, time, zlib, queue, shutil, shelve, struct, pickle, threading
+from shelfio import putraw, delraw, files, fsyncdir
+
+FRAME = '<II'                                           # Payload length, crc32
+MISSING = object()
+
+
+def frames(path):
+    '''
+    (key, pickle) of each whole record in log path; pickle None for a
+    delete. Stops at the first torn or corrupt record.
+    '''
+    size = struct.calcsize(FRAME)
+    with open(path, 'rb') as file:
+        data = file.read()
+    at = 0
+    while at + size <= len(data):
+        (length, crc) = struct.unpack_from(FRAME, data, at)
+        payload = data[at + size:at + size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        yield pickle.loads(payload)
+        at += size + length
+
+
+def copyfile(source, target):
+    '''
+    Copy source to target durably: whole or not at all, even on a crash.
+    '''
+    temp = target + '.tmp'
+    shutil.copyfile(source, temp)
+    with open(temp, 'rb+') as file:
+        os.fsync(file.fileno())
+    os.replace(temp, target)
+    fsyncdir(target)
+
+
+class WALStore:
+    def __init__(self, filename='persondb', maxbatch=256, maxdelay=0.005,
+                 checkpoint=4 * 2**20, sync=True, protocol=None):
+        self.filename = filename
+        self.protocol = protocol or pickle.DEFAULT_PROTOCOL
+        self.maxbatch = maxbatch                        # sync=False records buffered, at most
+        self.maxdelay = maxdelay                        # Seconds one of them waits, at most
+        self.checkpointsize = checkpoint                # Log bytes before a checkpoint
+        self.sync = sync
+        self.restore()
+        self.db = shelve.open(filename, 'c', self.protocol)
+        self.dblock = threading.Lock()                  # The shelve isn't thread-safe
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.overlay = {}                               # key => pickle (None: deleted), not yet in db
+        self.buffer = []                                # Frames not yet written
+        self.first = None                               # When the oldest of them came
+        self.seq = self.durable = 0                     # Records put, records fsynced
+        self.flushing = self.closing = False
+        self.error = None                               # What failed in the background, if anything
+        self.counts = dict(writes=0, fsyncs=0, checkpoints=0, replayed=0)
+        self.recover()
+        self.segno = 0
+        self.segment = self.newlog(0)
+        self.logsize = 0
+        self.checkpoints = queue.Queue()
+        self.threads = [threading.Thread(target=self.flusher), threading.Thread(target=self.checkpointer)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def logname(self, segno):
+        return '%s.wal.%d' % (self.filename, segno)
+
+    def lognames(self):
+        return sorted((self.filename + suffix for suffix in files(self.filename)
+                       if re.match(r'\.wal\.\d+$', suffix)),
+                      key=lambda name: int(name.rsplit('.', 1)[1]))
+
+    def newlog(self, segno):
+        segment = open(self.logname(segno), 'ab')
+        fsyncdir(self.logname(segno))                   # The log itself survives a crash
+        return segment
+
+    def dropfile(self, path):
+        os.remove(path)
+        fsyncdir(path)                                  # Gone for good: never replayed again
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    # Writes: logged, then durable
+
+    def put(self, key, person):
+        '''
+        Log person under key without waiting; returns its sequence number.
+        '''
+        return self.log(key, pickle.dumps(person, self.protocol))
+
+    def log(self, key, data):
+        payload = pickle.dumps((key, data), self.protocol)
+        frame = struct.pack(FRAME, len(payload), zlib.crc32(payload)) + payload
+        with self.lock:
+            self.check()
+            self.overlay[key] = data
+            self.buffer.append(frame)
+            self.seq += 1
+            self.counts['writes'] += 1
+            if self.first is None:
+                self.first = time.monotonic()
+                self.changed.notify_all()               # Flusher: start the clock
+            elif len(self.buffer) >= self.maxbatch:
+                self.changed.notify_all()               # Flusher: batch full
+            return self.seq
+
+    def wait(self, seq):
+        '''
+        Wait until record seq and all before it are fsynced, leading
+        the fsync if none is in flight.
+        '''
+        with self.lock:
+            while self.durable < seq:
+                self.check()
+                if self.flushing:
+                    self.changed.wait()                 # Follower: the next batch
+                else:
+                    self.flush()                        # Leader: everything buffered
+
+    def commit(self):
+        '''
+        Flush everything put so far, now, and wait until it's fsynced.
+        '''
+        self.wait(self.seq)
+
+    def __setitem__(self, key, person):
+        seq = self.put(key, person)
+        if self.sync:
+            self.wait(seq)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        seq = self.log(key, None)
+        if self.sync:
+            self.wait(seq)
+
+    # Reads: the overlay first, then the shelve
+
+    def __getitem__(self, key):
+        with self.lock:
+            data = self.overlay.get(key, MISSING)
+        if data is MISSING:
+            with self.dblock:
+                return self.db[key]
+        if data is None:
+            raise KeyError(key)
+        return pickle.loads(data)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def keys(self):
+        with self.lock:
+            overlay = dict(self.overlay)
+        with self.dblock:
+            keys = set(self.db.keys())
+        keys.update(key for (key, data) in overlay.items() if data is not None)
+        return sorted(keys.difference(key for (key, data) in overlay.items() if data is None))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    # Group commit and checkpoints
+
+    def flush(self):
+        '''
+        Write and fsync every buffered record, as the one flush in
+        flight; called with the lock held, which it drops meanwhile so
+        others can log on. A failure is kept in self.error.
+        '''
+        (batch, upto) = (b''.join(self.buffer), self.seq)
+        (self.buffer, self.first, self.flushing) = ([], None, True)
+        self.lock.release()
+        try:
+            self.segment.write(batch)
+            self.segment.flush()
+            os.fsync(self.segment.fileno())
+            error = None
+        except Exception as exc:
+            error = exc
+        finally:
+            self.lock.acquire()
+        self.flushing = False
+        if error is None:
+            self.logsize += len(batch)
+            self.durable = upto
+            self.counts['fsyncs'] += 1
+            if self.logsize >= self.checkpointsize:
+                try:
+                    self.rotate()
+                except Exception as exc:
+                    error = exc
+        if error is not None and self.error is None:
+            self.error = error
+        self.changed.notify_all()
+
+    def flusher(self):
+        '''
+        Flush records nobody waits for -- sync=False puts -- once the
+        oldest is maxdelay seconds old or maxbatch are buffered.
+        '''
+        with self.lock:
+            while self.error is None:
+                if not self.buffer:
+                    if self.closing:
+                        return
+                    self.changed.wait()
+                    continue
+                left = self.first + self.maxdelay - time.monotonic()
+                if self.flushing:
+                    self.changed.wait()                 # Its leader notifies when done
+                elif left > 0 and len(self.buffer) < self.maxbatch and not self.closing:
+                    self.changed.wait(left)
+                else:
+                    self.flush()
+
+    def rotate(self):
+        '''
+        Start a new log and queue the old one's checkpoint; called with
+        the lock held, after a flush, so the old log is complete.
+        '''
+        self.segment.close()
+        self.checkpoints.put((self.logname(self.segno), dict(self.overlay)))
+        self.segno += 1
+        self.segment = self.newlog(self.segno)
+        self.logsize = 0
+
+    def checkpointer(self):
+        while True:
+            work = self.checkpoints.get()
+            if work is None:
+                return
+            try:
+                self.apply(*work)
+            except Exception as exc:
+                with self.lock:
+                    if self.error is None:
+                        self.error = exc
+                    self.changed.notify_all()
+                return
+
+    def apply(self, logname, records):
+        '''
+        Write records into the shelve, make them durable there, then
+        drop logname and the overlay entries not changed since.
+        '''
+        with self.dblock:
+            self.backup()
+            for (key, data) in records.items():
+                self.store(key, data)
+            self.dbsync()
+            self.dropbackup()
+        self.dropfile(logname)
+        with self.lock:
+            for (key, data) in records.items():
+                if self.overlay.get(key, MISSING) is data:
+                    del self.overlay[key]
+            self.counts['checkpoints'] += 1
+
+    def store(self, key, data):
+        if data is not None:
+            putraw(self.db, key, data)                  # Already pickled: no second dumps
+        else:
+            delraw(self.db, key)
+
+    def dbsync(self):
+        self.db.sync()
+        for suffix in files(self.filename):
+            if '.wal.' not in suffix:
+                with open(self.filename + suffix, 'rb+') as file:
+                    os.fsync(file.fileno())
+
+    # The shelve's index: kept safe while the shelve is written
+
+    def backup(self):
+        '''
+        Save the index as last synced, NAME.dir, to NAME.wal.dir, durably,
+        before the shelve is written; dbm.dumb only, others have no .dir.
+        '''
+        if os.path.exists(self.filename + '.dir') and not os.path.exists(self.filename + '.wal.dir'):
+            copyfile(self.filename + '.dir', self.filename + '.wal.dir')
+
+    def dropbackup(self):
+        if os.path.exists(self.filename + '.wal.dir'):
+            self.dropfile(self.filename + '.wal.dir')
+
+    def restore(self):
+        '''
+        Put back an index saved by a checkpoint a crash cut short; the
+        logs it was checkpointing are all still there, for recover().
+        '''
+        if os.path.exists(self.filename + '.wal.dir'):
+            copyfile(self.filename + '.wal.dir', self.filename + '.dir')
+
+    def recover(self):
+        '''
+        Replay the logs a crash left into the shelve, oldest first.
+        '''
+        lognames = self.lognames()
+        if not lognames:
+            self.dropbackup()
+            return
+        with self.dblock:
+            self.backup()
+            for logname in lognames:
+                for (key, data) in frames(logname):
+                    self.store(key, data)
+                    self.counts['replayed'] += 1
+            self.dbsync()
+            self.dropbackup()
+        for logname in lognames:
+            self.dropfile(logname)
+
+    def close(self):
+        '''
+        Write and checkpoint everything; raises what failed, if anything
+        did, after closing all the same (the logs stay, for replay).
+        '''
+        try:
+            self.commit()
+        finally:
+            with self.lock:
+                self.closing = True
+                self.changed.notify_all()
+            self.threads[0].join()
+            self.checkpoints.put(None)
+            self.threads[1].join()
+            self.segment.close()
+            try:
+                if self.error is None:
+                    self.apply(self.logname(self.segno), dict(self.overlay))
+            finally:
+                self.db.close()
+        self.check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+
+if __name__ == '__main__':
+    import sys, tempfile, multiprocessing
+    from person import Person
+
+    def arg(flag, default, type=int):
+        return type(sys.argv[sys.argv.index(flag) + 1]) if flag in sys.argv else default
+    n = arg('-n', 4000)
+    threads = arg('-threads', 8)
+    options = dict(maxbatch=arg('-maxbatch', 256), maxdelay=arg('-maxdelay', 0.005, float))
+    folder = tempfile.mkdtemp()
+    people = [Person('Person %d' % i, 'dev', 40000 + i) for i in range(n)]
+
+    def timed(label, filename, run, *args):
+        start = time.perf_counter()
+        counts = run(filename, *args)
+        seconds = time.perf_counter() - start
+        print('%-36s %8.0f writes/s %s' % (label, n / seconds, counts or ''))
+
+    def fsynced(filename):                              # Durable per write, the hard way
+        db = shelve.open(filename)
+        for person in people:
+            db[person.name] = person
+            db.sync()
+            for suffix in files(filename):
+                with open(filename + suffix, 'rb+') as file:
+                    os.fsync(file.fileno())
+        db.close()
+
+    def plain(filename):                                # No durability till close
+        db = shelve.open(filename)
+        for person in people:
+            db[person.name] = person
+        db.close()
+
+    def grouped(filename, threads):
+        db = WALStore(filename, **options)
+        def work(part):
+            for person in part:
+                db[person.name] = person                # Returns once fsynced
+        workers = [threading.Thread(target=work, args=(people[i::threads],))
+                   for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        db.close()
+        return db.counts
+
+    def payroll(filename):
+        db = WALStore(filename, sync=False, **options)
+        for person in people:
+            db[person.name] = person
+        db.commit()                                     # One wait, for all of it
+        db.close()
+        return db.counts
+
+    timed('shelve, fsync per write', os.path.join(folder, 'a'), fsynced)
+    timed('shelve, no fsync', os.path.join(folder, 'b'), plain)
+    timed('WALStore, 1 thread, sync', os.path.join(folder, 'c1'), grouped, 1)
+    timed('WALStore, %d threads, sync' % threads, os.path.join(folder, 'c'), grouped, threads)
+    timed('WALStore, sync=False + commit()', os.path.join(folder, 'd'), payroll)
+
+    def crash(filename):                                # Commit, then die without close()
+        db = WALStore(filename, checkpoint=2**16)
+        for person in people:
+            db.put(person.name, person)
+        db.commit()
+        os._exit(0)
+    filename = os.path.join(folder, 'e')
+    child = multiprocessing.Process(target=crash, args=(filename,))
+    child.start()
+    child.join()
+    with WALStore(filename) as db:
+        print('after a crash: %d logged records replayed, %d of %d people there'
+              % (db.counts['replayed'], len(db), n))
+        assert all(db[person.name].pay == person.pay for person in people)
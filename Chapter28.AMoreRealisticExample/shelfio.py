@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#--------------------------------------------------
+# Usage: from shelfio import getraw, putraw, delraw, files, fsyncdir
+# Description: pickled-record access to a shelve, its files, and folder fsyncs
+#--------------------------------------------------
+
+
+
+'''
+db[key] on a shelve unpickles, and db[key] = person pickles, every time.
+PersonStore, PersonCache and WALStore already hold a record's pickle
+-- made once in a scan, kept as read, or logged -- so they read and
+write the pickle bytes as is through these, not through db[key]. They
+use two shelve.Shelf internals, its dbm object (shelf.dict) and its key
+encoding (shelf.keyencoding), and this is the one place that does.
+
+files(base) lists the files a shelve (or PersonStore) is made of, for
+copying or fsyncing them, and fsyncdir(path) fsyncs the folder path is
+in: a rename, create or delete there is durable only after that, not
+after fsyncing the file itself. Nothing here needs more than os, so
+SnapshotDB's Unix-only locking stays out of code that only needs these.
+'''
+
+
+import os
+
+
+def rawkey(shelf, key):
+    return key.encode(shelf.keyencoding)
+
+
+def getraw(shelf, key):
+    '''
+    The pickle stored under key, not unpickled; KeyError if none.
+    '''
+    return shelf.dict[rawkey(shelf, key)]
+
+
+def putraw(shelf, key, data):
+    '''
+    Store data, a pickle already made, under key.
+    '''
+    shelf.dict[rawkey(shelf, key)] = data
+
+
+def delraw(shelf, key):
+    '''
+    Delete key's record if there is one; True if there was.
+    '''
+    raw = rawkey(shelf, key)
+    if raw not in shelf.dict:
+        return False
+    del shelf.dict[raw]
+    return True
+
+
+def files(base):
+    '''
+    Suffixes of the files making up dbm (or PersonStore) base: '.dat',
+    '.dir', '-index.dat', or '' for a one-file dbm.
+    '''
+    (folder, prefix) = os.path.split(base)
+    folder = folder or '.'
+    return [name[len(prefix):] for name in sorted(os.listdir(folder))
+            if name.startswith(prefix) and name[len(prefix):][:1] in ('', '.', '-')
+            and os.path.isfile(os.path.join(folder, name))]
+
+
+def fsyncdir(path):
+    '''
+    fsync the folder holding path; a no-op where folders can't be
+    opened to fsync (Windows).
+    '''
+    if os.name != 'posix':
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#--------------------------------------------------
+# Usage: from snapshotdb import SnapshotDB
+# Description: many reader processes and one writer on a persondb shelve
+#--------------------------------------------------
+
+
+
+'''
+shelve has no locking: two processes running updatedb.py at once can
+both rewrite the dbm files and leave them corrupt, and a process reading
+while another writes can see half a write. SnapshotDB gives a shelve
+like persondb many concurrent readers and one writer at a time, MVCC
+style, with copy-on-write snapshots of the whole database:
+
+    NAME.snapshots/current      number of the newest snapshot, N
+    NAME.snapshots/N.dat ...    snapshot N's dbm files
+    NAME.snapshots/lock.N       held shared by each reader of snapshot N
+    NAME.snapshots/writer.lock  held exclusive by the one writer
+
+reader() opens the newest snapshot read-only and holds lock.N shared
+while it's open; it never waits for a writer, however long its update.
+writer() takes writer.lock (so writers queue up), copies snapshot N to
+N + 1, and yields N + 1's shelve to change; on a clean exit it closes
+and fsyncs it and publishes it by renaming a new current into place, so
+readers that start later see all of the update and earlier ones go on
+with all of N. An exception, or a crash, leaves N current and the copy
+is discarded. After publishing, the writer deletes each older snapshot
+whose lock.N it can take exclusive without waiting -- those no reader
+still has open.
+
+A first SnapshotDB('persondb') starts snapshot 0 from the plain shelve's
+files (persondb.dat and the rest, plus any persondb-index files), which
+are left as they were; only that first open takes writer.lock, so
+opening one for reading never waits on a writer either. opener opens a snapshot: shelve.open by default,
+or another class taking (filename, flag), such as PersonStore. Each
+commit copies the whole database, which suits persondb-sized data and
+batched updates like PersonStore.update, not a stream of single writes.
+Locks are fcntl.flock's, so Unix only.
+'''
+
+
+import os, time, shutil, shelve, fcntl, contextlib
+from shelfio import files
+
+
+class SnapshotDB:
+    def __init__(self, filename='persondb', opener=shelve.open):
+        self.filename = filename
+        self.folder = filename + '.snapshots'
+        self.opener = opener
+        os.makedirs(self.folder, exist_ok=True)
+        if not os.path.exists(self.path('current')):    # Only the first open locks: not readers
+            with self.writelock():
+                if not os.path.exists(self.path('current')):    # Not started while we waited
+                    self.start()
+
+    def path(self, name):
+        return os.path.join(self.folder, str(name))
+
+    @contextlib.contextmanager
+    def writelock(self):
+        with open(self.path('writer.lock'), 'a') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)            # Released when the file closes
+            yield
+
+    def start(self):
+        first = self.path(0)
+        for suffix in files(self.filename):
+            shutil.copyfile(self.filename + suffix, first + suffix)
+        self.opener(first, 'c').close()                 # Makes what's missing: all, or an index
+        open(self.path('lock.0'), 'a').close()
+        self.publish(0)
+
+    def current(self):
+        with open(self.path('current')) as file:
+            return int(file.read())
+
+    def publish(self, number):
+        temp = self.path('current.tmp')
+        with open(temp, 'w') as file:
+            file.write(str(number))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, self.path('current'))          # Readers see N or N + 1, whole
+
+    @contextlib.contextmanager
+    def reader(self):
+        '''
+        The newest snapshot, opened read-only for the with block.
+        '''
+        delay = 0.0001
+        while True:
+            number = self.current()
+            try:
+                lock = os.open(self.path('lock.%d' % number), os.O_RDONLY)
+            except FileNotFoundError:                   # Collected since: look again
+                lock = None
+            if lock is not None:
+                fcntl.flock(lock, fcntl.LOCK_SH)
+                if os.fstat(lock).st_nlink:             # Not collected while we locked
+                    break
+                os.close(lock)
+            time.sleep(delay)                           # Let the writer publish; don't spin
+            delay = min(delay * 2, 0.01)
+        try:
+            db = self.opener(self.path(number), 'r')
+            try:
+                yield db
+            finally:
+                db.close()
+        finally:
+            os.close(lock)                              # Unlocks it
+
+    @contextlib.contextmanager
+    def writer(self):
+        '''
+        A copy of the newest snapshot, opened to change for the with
+        block and published as the newest when it exits normally.
+        '''
+        with self.writelock():
+            number = self.current()
+            (old, new) = (self.path(number), self.path(number + 1))
+            self.remove(number + 1)                     # A dead writer's leftovers
+            for suffix in files(old):
+                shutil.copyfile(old + suffix, new + suffix)
+            db = self.opener(new, 'w')
+            try:
+                yield db
+            except BaseException:
+                db.close()
+                self.remove(number + 1)
+                raise
+            db.close()
+            for suffix in files(new):
+                with open(new + suffix, 'rb+') as file:
+                    os.fsync(file.fileno())
+            open(self.path('lock.%d' % (number + 1)), 'a').close()
+            self.publish(number + 1)
+            self.collect(number + 1)
+
+    def remove(self, number):
+        base = self.path(number)
+        for suffix in files(base):
+            os.remove(base + suffix)
+
+    def collect(self, current=None):
+        '''
+        Delete the snapshots older than current that no reader has open.
+        '''
+        current = self.current() if current is None else current
+        for name in os.listdir(self.folder):
+            if not name.startswith('lock.') or int(name[5:]) >= current:
+                continue
+            try:
+                lock = os.open(self.path(name), os.O_RDONLY)
+            except FileNotFoundError:                   # Another collect() got it first
+                continue
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:                     # Still being read
+                os.close(lock)
+                continue
+            if os.fstat(lock).st_nlink:
+                self.remove(int(name[5:]))
+                os.remove(self.path(name))              # Readers waiting on it will see nlink 0
+            os.close(lock)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#--------------------------------------------------
+# Usage: python3 snapshotdb_stress.py [-readers N] [-writers N] [-seconds S] [-people N]
+# Description: reader and writer processes hammering one SnapshotDB
+#--------------------------------------------------
+
+
+
+'''
+Stress test for snapshotdb.py: -readers processes (default 4) and
+-writers processes (default 2) share one SnapshotDB of -people people
+(default 1000, pay 1000 each) for -seconds seconds (default 5).
+
+Writers commit transfers -- pay moved from one person to another, so
+total pay never changes -- and every tenth commit is a bulk update that
+rewrites every record (everyone passes 1 to the next person). Each
+commit also adds 1 to the '#commits' record. Readers check every
+snapshot they open: all the people there, total pay unchanged, and
+'#commits' never going backwards. At the end the newest snapshot must
+show every commit the writers made, and no snapshot files may be left
+but the newest. Prints commits and reads per second, and the longest
+any reader waited to open a snapshot, against the longest bulk update:
+readers should never wait for one.
+'''
+
+
+import os, sys, time, random, shelve, tempfile, multiprocessing
+from snapshotdb import SnapshotDB
+from person import Person
+
+PAY = 1000
+
+
+def people(db):
+    return [key for key in db if key != '#commits']
+
+
+def writer(filename, seconds, results):
+    db = SnapshotDB(filename)
+    (commits, longest) = (0, 0.0)
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        start = time.perf_counter()
+        with db.writer() as snap:
+            names = people(snap)
+            if commits % 10 == 9:                       # Bulk: rewrite everyone
+                for (name, after) in zip(names, names[1:] + names[:1]):
+                    (person, other) = (snap[name], snap[after])
+                    person.pay -= 1
+                    other.pay += 1
+                    snap[name] = person
+                    snap[after] = other
+            else:
+                (name, after) = random.sample(names, 2)
+                (person, other) = (snap[name], snap[after])
+                amount = random.randrange(person.pay + 1)
+                person.pay -= amount
+                other.pay += amount
+                snap[name] = person
+                snap[after] = other
+            snap['#commits'] += 1
+        commits += 1
+        if commits % 10 == 0:
+            longest = max(longest, time.perf_counter() - start)
+    results.put(('writer', commits, longest, []))
+
+
+def reader(filename, count, seconds, results):
+    db = SnapshotDB(filename)
+    (reads, waited, errors, last) = (0, 0.0, [], 0)
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        start = time.perf_counter()
+        with db.reader() as snap:
+            waited = max(waited, time.perf_counter() - start)
+            names = people(snap)
+            total = sum(snap[name].pay for name in names)
+            commits = snap['#commits']
+        if len(names) != count or total != count * PAY:
+            errors.append('%d people paid %d at commit %d' % (len(names), total, commits))
+        if commits < last:
+            errors.append('commit %d after %d' % (commits, last))
+        (reads, last) = (reads + 1, commits)
+    results.put(('reader', reads, waited, errors))
+
+
+def stress(readers=4, writers=2, seconds=5, count=1000):
+    filename = os.path.join(tempfile.mkdtemp(), 'persondb')
+    db = shelve.open(filename)
+    for i in range(count):
+        db['Person %d' % i] = Person('Person %d' % i, 'dev', PAY)
+    db['#commits'] = 0
+    db.close()
+
+    results = multiprocessing.Queue()
+    procs = ([multiprocessing.Process(target=writer, args=(filename, seconds, results))
+              for i in range(writers)] +
+             [multiprocessing.Process(target=reader, args=(filename, count, seconds, results))
+              for i in range(readers)])
+    for proc in procs:
+        proc.start()
+    got = [results.get() for proc in procs]
+    for proc in procs:
+        proc.join()
+
+    commits = sum(n for (role, n, longest, errors) in got if role == 'writer')
+    reads = sum(n for (role, n, longest, errors) in got if role == 'reader')
+    errors = [error for result in got for error in result[3]]
+    snapdb = SnapshotDB(filename)
+    with snapdb.reader() as snap:
+        final = (len(people(snap)), sum(snap[name].pay for name in people(snap)), snap['#commits'])
+    if final != (count, count * PAY, commits):
+        errors.append('final snapshot: %d people paid %d at commit %d, %d commits made'
+                      % (final + (commits,)))
+    snapdb.collect()
+    left = sorted(set(name.split('.')[0] for name in os.listdir(snapdb.folder)
+                      if name[0].isdigit()))
+    if left != [str(snapdb.current())]:
+        errors.append('snapshots left: %s' % left)
+
+    print('%d readers, %d writers, %d people, %ds' % (readers, writers, count, seconds))
+    print('commits: %d (%.1f/s), longest bulk update %.3fs'
+          % (commits, commits / seconds, max(r[2] for r in got if r[0] == 'writer')))
+    print('reads:   %d (%.1f/s), longest wait to open a snapshot %.3fs'
+          % (reads, reads / seconds, max(r[2] for r in got if r[0] == 'reader')))
+    print('errors:  %d' % len(errors))
+    for error in errors[:10]:
+        print('\t', error)
+    return not errors
+
+
+
+if __name__ == '__main__':
+    def arg(flag, default):
+        return int(sys.argv[sys.argv.index(flag) + 1]) if flag in sys.argv else default
+    ok = stress(arg('-readers', 4), arg('-writers', 2), arg('-seconds', 5), arg('-people', 1000))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#-----------------------------------
+# Usage: python3 3-slots_layouts.py [-max N] [-o results.csv]
+# Description: memory and speed of record layouts, from 3-slots_test.py
+#-----------------------------------
+
+
+
+'''
+3-slots_test.py times __slots__ against a plain class on one mix of
+creation and attribute access; this suite compares more ways to store
+the same record -- Chapter 28's Person(name, job, pay) -- and measures
+each cost apart, at 10**3, 10**4, ... up to -max instances (default
+10**5; 10**7 takes minutes and gigabytes):
+- bytes per instance: traced allocations (tracemalloc) of building the
+  whole collection, list or columns included, over the shared name and
+  job strings, which every layout points to alike;
+- creation rate, in records per second;
+- read rate: summing everyone's pay;
+- write rate: giving everyone Chapter 28's 10% raise, in each layout's
+  own idiom -- assignment for mutable records, a new record for tuples,
+  one vectorized multiply for NumPy;
+- pickle size per instance, at the highest protocol.
+Layouts: a plain class (per-instance __dict__), a __slots__ class, a
+namedtuple, a dataclass with and (3.10+) without __dict__, a plain
+tuple, and struct-of-arrays People columns backed by the array module
+and (if installed) NumPy. Rates are best of 3 runs (1 above 10**5).
+'''
+
+
+import sys, gc, time, array, pickle, tracemalloc
+from collections import namedtuple
+from dataclasses import dataclass
+
+try:
+    import numpy
+except ImportError:                                     # Optional: skip its layout
+    numpy = None
+
+
+
+class DictPerson:
+    def __init__(self, name, job=None, pay=0):
+        self.name = name
+        self.job = job
+        self.pay = pay
+
+
+class SlotsPerson:
+    __slots__ = ['name', 'job', 'pay']
+    def __init__(self, name, job=None, pay=0):
+        self.name = name
+        self.job = job
+        self.pay = pay
+
+
+TuplePerson = namedtuple('TuplePerson', 'name job pay')
+
+
+@dataclass
+class DataPerson:
+    name: str
+    job: str = None
+    pay: int = 0
+
+
+if sys.version_info >= (3, 10):
+    @dataclass(slots=True)
+    class SlotsDataPerson:
+        name: str
+        job: str = None
+        pay: int = 0
+else:
+    SlotsDataPerson = None                              # slots=True is 3.10+
+
+
+class People:
+    '''
+    Struct of arrays: one column per field; jobs are small codes into a
+    table of job names, pays a typed array (or NumPy array).
+    '''
+    def __init__(self, names, jobs, pays, vector=None):
+        self.names = list(names)
+        self.jobtable = sorted(set(jobs), key=str)
+        codes = dict((job, code) for (code, job) in enumerate(self.jobtable))
+        if vector:
+            self.jobs = vector.array([codes[job] for job in jobs], dtype=vector.uint8)
+            self.pays = vector.array(pays, dtype=vector.int64)
+        else:
+            self.jobs = array.array('B', [codes[job] for job in jobs])
+            self.pays = array.array('q', pays)
+
+    def __len__(self):
+        return len(self.names)
+
+
+
+def readattrs(people):
+    total = 0
+    for person in people:
+        total += person.pay
+    return total
+
+
+def writeattrs(people):
+    for person in people:
+        person.pay = int(person.pay * 1.10)
+
+
+def readindex(people):
+    total = 0
+    for person in people:
+        total += person[2]
+    return total
+
+
+def writereplace(people):
+    for (i, person) in enumerate(people):
+        people[i] = person._replace(pay=int(person.pay * 1.10))
+
+
+def writetuple(people):
+    for (i, (name, job, pay)) in enumerate(people):
+        people[i] = (name, job, int(pay * 1.10))
+
+
+def readcolumn(people):
+    total = 0
+    for pay in people.pays:
+        total += pay
+    return total
+
+
+def writecolumn(people):
+    pays = people.pays
+    for i in range(len(pays)):
+        pays[i] = int(pays[i] * 1.10)
+
+
+def readvector(people):
+    return int(people.pays.sum())
+
+
+def writevector(people):
+    people.pays[:] = people.pays * 1.10                 # Truncates, like int()
+
+
+def records(klass):
+    return lambda names, jobs, pays: [klass(*fields) for fields in zip(names, jobs, pays)]
+
+
+layouts = [('dict',      records(DictPerson),  readattrs,  writeattrs),   # (name, build, read, write)
+           ('slots',     records(SlotsPerson), readattrs,  writeattrs),
+           ('namedtuple', records(TuplePerson), readattrs, writereplace),
+           ('dataclass', records(DataPerson),  readattrs,  writeattrs)]
+if SlotsDataPerson:
+    layouts.append(('dataclass-slots', records(SlotsDataPerson), readattrs, writeattrs))
+layouts += [('tuple',    lambda names, jobs, pays: list(zip(names, jobs, pays)), readindex, writetuple),
+            ('array',    People, readcolumn, writecolumn)]
+if numpy:
+    layouts.append(('numpy', lambda names, jobs, pays: People(names, jobs, pays, numpy),
+                    readvector, writevector))
+
+
+
+def inputs(size):
+    '''
+    Shared field values for size records: distinct names, 4 jobs.
+    '''
+    names = ['name%d' % i for i in range(size)]
+    jobs = [(None, 'dev', 'mgr', 'ops')[i % 4] for i in range(size)]
+    pays = [50000 + i % 50000 for i in range(size)]
+    return (names, jobs, pays)
+
+
+def best(action, reps):
+    times = []
+    for i in range(reps):
+        start = time.perf_counter()
+        action()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def measure(build, read, write, fields, reps=3):
+    '''
+    One layout at one size: returns a dict of bytes, create, read and
+    write (records per second) and pickle (bytes), all per instance.
+    '''
+    size = len(fields[0])
+    gc.collect()                                        # Empties free lists: tuples reuse them
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    people = build(*fields)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    created = best(lambda: build(*fields), reps)
+    readtime = best(lambda: read(people), reps)
+    writetime = best(lambda: write(people), reps)
+    pickled = len(pickle.dumps(people, pickle.HIGHEST_PROTOCOL))
+    return dict(bytes=used / size, create=size / created, read=size / readtime,
+                write=size / writetime, pickle=pickled / size)
+
+
+def sweep(maxsize=10 ** 5):
+    '''
+    Measure every layout at sizes 10**3, 10**4, ... maxsize;
+    returns [(layout, size, results dict)].
+    '''
+    rows = []
+    size = 1000
+    while size <= maxsize:
+        fields = inputs(size)
+        reps = 3 if size <= 10 ** 5 else 1
+        for (name, build, read, write) in layouts:
+            rows.append((name, size, measure(build, read, write, fields, reps)))
+        size *= 10
+    return rows
+
+
+columns = ['bytes', 'create', 'read', 'write', 'pickle']
+
+
+def report(rows):
+    print('%-16s %9s %10s %12s %12s %12s %10s' % ('layout', 'size', 'bytes/obj', 'create/s',
+                                                  'read/s', 'write/s', 'pickle/obj'))
+    for (name, size, res) in rows:
+        print('%-16s %9d %10.1f %12.0f %12.0f %12.0f %10.1f' %
+              ((name, size) + tuple(res[key] for key in columns)))
+
+
+def writecsv(rows, file):
+    import csv
+    writer = csv.writer(file)
+    writer.writerow(['layout', 'size'] + columns)
+    for (name, size, res) in rows:
+        writer.writerow([name, size] + [res[key] for key in columns])
+
+
+def bench_layouts():                                    # python3 -m bench, from Chapter21
+    fields = inputs(10000)
+    pairs = []
+    for (name, build, read, write) in layouts:
+        res = measure(build, read, write, fields)
+        pairs += [('%s create' % name, 1 / res['create']),
+                  ('%s read' % name, 1 / res['read']),
+                  ('%s write' % name, 1 / res['write'])]
+    return pairs                                        # Seconds per record
+
+bench_layouts.tags = ['classes', 'slots', 'memory']
+
+
+
+if __name__ == '__main__':
+    maxsize = int(sys.argv[sys.argv.index('-max') + 1]) if '-max' in sys.argv else 10 ** 5
+    print(sys.version)
+    rows = sweep(maxsize)
+    report(rows)
+    if '-o' in sys.argv:
+        with open(sys.argv[sys.argv.index('-o') + 1], 'w', newline='') as file:
+            writecsv(rows, file)
@@ -55,16 +55,24 @@ class C:
     __slots__ = ['a', 'b', 'c', 'd']
 ''' + base
 
-print('Slots => ', end=' ')
-print(min(timeit.repeat(stmt=stmt, number=1000, repeat=3)))
-
 stmt1 = '''
 class C:
     pass
 ''' + base
 
-print('NonSlots => ', end=' ')
-print(min(timeit.repeat(stmt=stmt1, number=1000, repeat=3)))
+
+def bench_slots():                                      # python3 -m bench, from Chapter21
+    return [('Slots', min(timeit.repeat(stmt=stmt, number=1000, repeat=3))),
+            ('NonSlots', min(timeit.repeat(stmt=stmt1, number=1000, repeat=3)))]
+
+bench_slots.tags = ['classes', 'slots']
+
+
+
+if __name__ == '__main__':
+    for (label, best) in bench_slots():
+        print('%s => ' % label, end=' ')
+        print(best)
 
 
 '''
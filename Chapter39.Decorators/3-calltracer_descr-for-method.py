@@ -8,16 +8,24 @@
 #--------------------------------------------
 
 
+import metrics                      # Publishes calls process-wide
+from counter import ShardedCounter  # Thread-safe, lock-free calls
+
+
 class Tracer:       # a decorator + descriptor
     def __init__(self, func):       # on @ decorator
         print('in property descriptor __init__')
-        self.calls = 0
+        self.counter = ShardedCounter()
         self.func = func
+        metrics.countcalls(func, lambda: self.calls)
     def __call__(self, *args, **kwargs):        # on call to original func
         print('in property descriptor __call__')
-        self.calls += 1
+        self.counter.add()
         print('call %s to %s' % (self.calls, self.func.__name__))
         return self.func(*args, **kwargs)
+    @property
+    def calls(self):                            # int, as before: shards summed
+        return self.counter.value
     def __get__(self, instance, owner):         # on method attribute fetch
         print('in property descriptor __get__')
         return Wrapper(self, instance)
@@ -8,12 +8,51 @@
 #-----------------------------------------------
 
 
-def tracer(func):               # State via enclosing scope and function attribute
-    def wrapper(*args, **kwargs):       # calls are per-function, not global
-        wrapper.calls += 1
-        print('call %s to %s' % (wrapper.calls, func.__name__))
-        return func(*args, **kwargs)
-    wrapper.calls = 0
+'''
+@tracer traces every call; @tracer(sample_rate=N) traces only every
+Nth call (per thread), or with randomly=True a random 1 in N, for hot
+functions left traced for good. Every call is still counted in the
+every-Nth mode, so calls is exact there; with randomly=True only traced
+calls are counted, each as N, so calls is an estimate. The count lives
+in a ShardedCounter (see counter.py), so threads calling one traced
+function never lose counts nor wait on each other; wrapper.calls reads
+it as an int, as before. Each tracer's count is also published in
+metrics.py's registry. The wrapper keeps func's __name__ and __doc__,
+and binds like a function does, so @tracer works on methods too.
+'''
+
+
+import types, random, functools
+import metrics
+from counter import ShardedCounter
+
+
+def tracer(func=None, sample_rate=1, randomly=False):  # State via enclosing scope and wrapper attribute
+    if func is None:                    # @tracer(...): options first
+        return lambda func: tracer(func, sample_rate, randomly)
+    chance = random.random
+    class Wrapper:                      # calls are per-function, not global
+        def __init__(self):
+            self.counter = ShardedCounter()
+            functools.update_wrapper(self, func)    # __name__, __doc__, ...
+        def __get__(self, instance, owner):         # On a method: bind self, like a function
+            if instance is None:
+                return self
+            return types.MethodType(self, instance)
+        @property
+        def calls(self):                # int: all threads' shards summed
+            return self.counter.value
+        def __call__(self, *args, **kwargs):
+            if randomly:
+                if chance() * sample_rate >= 1:
+                    return func(*args, **kwargs)
+                self.counter.add(sample_rate)       # One traced call stands for N
+            elif self.counter.add() % sample_rate:  # Every Nth call per thread
+                return func(*args, **kwargs)
+            print('call %s to %s' % (self.calls, func.__name__))
+            return func(*args, **kwargs)
+    wrapper = Wrapper()
+    metrics.countcalls(func, lambda: wrapper.calls)
     return wrapper
 
 
@@ -34,3 +73,10 @@ if __name__ == '__main__':
 
     eggs(2, 16)
     eggs(4, 7)
+
+    @tracer(sample_rate=1000)
+    def ham(x):                 # Hot: trace 1 call in 1000
+        return x
+    for i in range(5000):
+        ham(i)
+    print('ham calls: %s' % ham.calls)
@@ -8,23 +8,43 @@
 #-----------------------------------------------
 
 
+'''
+Each call's time goes into a fixed-memory histogram (histogram.py), so
+snapshot() gives count, mean, p50, p90, p99 and max, and reset() starts
+over; set Timer.trace = True to print every call as well. Timers show
+up in metrics.py's process-wide registry too.
+'''
+
+
 import sys
 import time
+from histogram import Histogram, summary
+import metrics
 
 
 force = list if sys.version_info[0] == 3 else lambda X: X
 
 class Timer:
+    trace = False                           # True: print every call
     def __init__(self, func):
         self.func = func
-        self.alltime = 0
+        self.histogram = Histogram()
+        metrics.timecalls(func, self.snapshot)
     def __call__(self, *args, **kwargs):
-        start = time.time()
+        start = time.perf_counter_ns()
         result = self.func(*args, **kwargs)
-        elapsed = time.time() - start
-        self.alltime += elapsed
-        print('%s: %.5f, %.5f' % (self.func.__name__, elapsed, self.alltime))
+        elapsed = time.perf_counter_ns() - start
+        self.histogram.record(elapsed)
+        if self.trace:
+            print('%s: %.5f, %.5f' % (self.func.__name__, elapsed / 1e9, self.alltime))
         return result
+    @property
+    def alltime(self):
+        return self.histogram.total / 1e9
+    def snapshot(self):
+        return self.histogram.snapshot()
+    def reset(self):
+        self.histogram.reset()
 
 
 
@@ -48,6 +68,7 @@ if __name__ == '__main__':
     listcomp(1000000)
     print(result)
     print('allTime = %s' % listcomp.alltime)
+    print(summary(listcomp.snapshot()))
     print('\n')
     
     print('\033[1;37mmapcall function\033[0m')
@@ -57,4 +78,5 @@ if __name__ == '__main__':
     mapcall(1000000)
     print(result)
     print('allTime = %s' % mapcall.alltime)
+    print(summary(mapcall.snapshot()))
     print('\nmapcall = %s' % round(mapcall.alltime / listcomp.alltime, 3))
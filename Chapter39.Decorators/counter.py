@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#--------------------------------------------
+# Usage: from counter import ShardedCounter
+# Description: per-thread sharded call counter for the tracers
+#--------------------------------------------
+
+
+
+'''
+calls += 1 is a read, an add and a write: two threads can read the
+same count and both write back count + 1, losing a call, and a lock
+around it makes every traced call queue up behind every other. A
+ShardedCounter instead gives each thread its own one-item list (its
+shard), reached through threading.local; add() touches only the
+calling thread's shard, so no update is ever lost and threads never
+wait for each other, and value sums all the shards when it's read.
+add() returns the calling thread's own count, enough for the tracers'
+every-Nth-call sampling. Shards of finished threads stay in the sum.
+'''
+
+
+import threading
+
+
+class ShardedCounter:
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.lock = threading.Lock()                    # Only for adding a shard
+
+    def newshard(self):
+        shard = self.local.shard = [0]
+        with self.lock:
+            self.shards.append(shard)
+        return shard
+
+    def add(self, count=1):
+        '''
+        Add count for the calling thread; returns its own running count.
+        '''
+        try:
+            shard = self.local.shard
+        except AttributeError:                          # First add in this thread
+            shard = self.newshard()
+        shard[0] += count
+        return shard[0]
+
+    @property
+    def value(self):
+        return sum(shard[0] for shard in list(self.shards))
+
+    def reset(self):
+        '''
+        Zero every shard; adds racing with a reset may survive it.
+        '''
+        for shard in list(self.shards):
+            shard[0] = 0
+
+    def __repr__(self):
+        return '<ShardedCounter %d in %d shards>' % (self.value, len(self.shards))
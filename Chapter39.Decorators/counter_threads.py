@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#---------------------------------------------
+# Usage: python3 counter_threads.py [-calls N]
+# Description: call counting under 1 to 32 threads: plain, locked, sharded
+#---------------------------------------------
+
+
+'''
+Three ways for a tracer to count calls, each timed with 1, 2, 4, ...
+32 threads sharing one counted function and N calls in all (default
+320000): the tracers' old unsynchronized calls += 1, the same under
+a threading.Lock, and counter.py's ShardedCounter. Prints calls per
+second and how many calls each one failed to count. With the GIL the
+plain count loses updates only when a thread switch lands inside the
++=, so losses are rare on recent CPythons; a free-threaded build loses
+them freely, and there a lock also contends where shards do not.
+'''
+
+
+import sys, time, threading
+from counter import ShardedCounter
+
+
+def plain(func):
+    def wrapper(*args, **kwargs):
+        wrapper.calls += 1
+        return func(*args, **kwargs)
+    wrapper.calls = 0
+    wrapper.count = lambda: wrapper.calls
+    return wrapper
+
+
+def locked(func):
+    lock = threading.Lock()
+    def wrapper(*args, **kwargs):
+        with lock:
+            wrapper.calls += 1
+        return func(*args, **kwargs)
+    wrapper.calls = 0
+    wrapper.count = lambda: wrapper.calls
+    return wrapper
+
+
+def sharded(func):
+    def wrapper(*args, **kwargs):
+        wrapper.calls.add()
+        return func(*args, **kwargs)
+    wrapper.calls = ShardedCounter()
+    wrapper.count = lambda: wrapper.calls.value
+    return wrapper
+
+
+def work():
+    pass
+
+
+def run(counted, threads, calls):
+    '''
+    calls of counted() split over threads started together; returns
+    (seconds, calls counted).
+    '''
+    each = calls // threads
+    ready = threading.Barrier(threads + 1)
+    def loop():
+        ready.wait()
+        for i in range(each):
+            counted()
+    workers = [threading.Thread(target=loop) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    ready.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start, counted.count())
+
+
+def sweep(calls=320000, counts=(1, 2, 4, 8, 16, 32)):
+    '''
+    Returns [(variant, threads, calls per second, calls lost)].
+    '''
+    rows = []
+    for threads in counts:
+        for deco in (plain, locked, sharded):
+            (seconds, counted) = run(deco(work), threads, calls)
+            expected = calls // threads * threads
+            rows.append((deco.__name__, threads, expected / seconds, expected - counted))
+    return rows
+
+
+def bench_counters():                                   # python3 -m bench, from Chapter21
+    return [('%s x%d' % (name, threads), 1 / rate)
+            for (name, threads, rate, lost) in sweep(counts=(1, 8))]
+
+bench_counters.tags = ['decorators', 'threads']
+
+
+
+if __name__ == '__main__':
+    calls = int(sys.argv[sys.argv.index('-calls') + 1]) if '-calls' in sys.argv else 320000
+    print(sys.version)
+    print('%-8s %7s %14s %8s' % ('counter', 'threads', 'calls/sec', 'lost'))
+    for (name, threads, rate, lost) in sweep(calls):
+        print('%-8s %7d %14.0f %8d' % (name, threads, rate, lost))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#--------------------------------------------
+# Usage: python3 histogram.py
+# Description: fixed-memory log-linear latency histogram for the timers
+#--------------------------------------------
+
+
+
+'''
+A latency histogram in the style of HdrHistogram, for the timer
+decorators: record() files each call's duration (integer ns, from
+time.perf_counter_ns) into one of a fixed set of buckets, so memory
+stays the same after a million calls as after one, and percentiles
+come from bucket counts instead of a list of every time.
+Buckets are log-linear: values below 2 * 2**bits get one bucket each
+(exact), and every power-of-2 range above that is split into 2**bits
+equal buckets, so any value is off by less than 1 / 2**bits of itself
+(under 1% at the default bits=7). Values at or above 2**maxbits ns
+(about 18 minutes at 40) share the last bucket; max stays exact.
+snapshot() returns count, total, mean, p50, p90, p99 and max, in
+seconds like the timers' alltime; reset() starts over. Timers that
+time only a sample of their calls report through scaled().
+'''
+
+
+class Histogram:
+    def __init__(self, bits=7, maxbits=40):
+        self.bits = bits
+        self.size = 1 << bits                           # Buckets per power of 2
+        self.limit = (maxbits - bits + 1) * self.size
+        self.counts = [0] * self.limit
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = self.total = self.max = 0
+
+    def index(self, value):
+        shift = value.bit_length() - self.bits - 1
+        if shift <= 0:
+            return value                                # Linear: exact
+        return min((shift << self.bits) + (value >> shift), self.limit - 1)
+
+    def bounds(self, index):
+        '''
+        (lowest, highest) value that lands in bucket index.
+        '''
+        shift = index // self.size - 1
+        if shift <= 0:
+            return (index, index)
+        top = index - shift * self.size
+        return (top << shift, ((top + 1) << shift) - 1)
+
+    def record(self, value):
+        '''
+        Count one duration, in integer nanoseconds; index() inlined, as
+        this runs on every timed call (and timerdeco2's Timer inlines
+        this in turn: keep the two the same).
+        '''
+        shift = value.bit_length() - self.bits - 1
+        index = value if shift <= 0 else (shift << self.bits) + (value >> shift)
+        if index >= self.limit:
+            index = self.limit - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        '''
+        Value (ns) at or below which percent of the recorded values lie,
+        to bucket precision; never more than the true max.
+        '''
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * percent // 100))  # Ceiling, integer math
+        seen = 0
+        for (index, count) in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bounds(index)[1], self.max)
+        return self.max
+
+    def snapshot(self):
+        '''
+        Summary of everything recorded so far, times in seconds.
+        '''
+        return dict(count=self.count,
+                    total=self.total / 1e9,
+                    mean=self.total / self.count / 1e9 if self.count else 0.0,
+                    p50=self.percentile(50) / 1e9,
+                    p90=self.percentile(90) / 1e9,
+                    p99=self.percentile(99) / 1e9,
+                    max=self.max / 1e9)
+
+
+def scaled(snap, calls):
+    '''
+    Snapshot of a timer that timed only some of its calls: count becomes
+    the calls made, samples the calls timed, and total is scaled up by
+    calls / samples; the samples' mean and percentiles stand for all.
+    '''
+    snap = dict(snap, samples=snap['count'], count=calls)
+    if snap['samples']:
+        snap['total'] *= calls / snap['samples']
+    return snap
+
+
+def summary(snap):
+    '''
+    One line of text for a snapshot, times in microseconds.
+    '''
+    return ('count=%d mean=%.2fus p50=%.2fus p90=%.2fus p99=%.2fus max=%.2fus' %
+            (snap['count'], snap['mean'] * 1e6, snap['p50'] * 1e6,
+             snap['p90'] * 1e6, snap['p99'] * 1e6, snap['max'] * 1e6))
+
+
+
+if __name__ == '__main__':
+    import random
+    hist = Histogram()
+    values = [int(random.lognormvariate(9, 1)) for i in range(100000)]
+    for value in values:
+        hist.record(value)
+    values.sort()
+    print(summary(hist.snapshot()))
+    for percent in (50, 90, 99):
+        exact = values[-(-len(values) * percent // 100) - 1]
+        print('p%d: histogram %d ns, exact %d ns' % (percent, hist.percentile(percent), exact))
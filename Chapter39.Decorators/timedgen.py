@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#--------------------------------------------
+# Usage: from timedgen import timedgen, kind
+# Description: generator and coroutine support for the timer decorators
+#--------------------------------------------
+
+
+
+'''
+Timing a generator function or an async def function call by call
+only times making the generator or coroutine object, not running it.
+kind(func) tells the timers which case they have: 'async', 'generator'
+or 'function'. For an async function the timers await the coroutine
+and time the call until it completes, awaits included. For a
+generator function they wrap the generator in timedgen(), which times
+each step of it -- the time inside each next(), send() or throw() the
+consumer makes, not the consumer's own time between items -- and
+records each step into items, the first step into first (time to the
+first item, from the first next(), as a generator runs no code before
+that), and the sum of all steps into totals once the generator is
+exhausted, closed, or dropped.
+'''
+
+
+import inspect
+from histogram import Histogram, scaled
+
+
+def kind(func):
+    '''
+    'async', 'generator' or 'function': how a timer must time func.
+    '''
+    if inspect.iscoroutinefunction(func):
+        return 'async'
+    if inspect.isgeneratorfunction(func):
+        return 'generator'
+    return 'function'
+
+
+class GenStats:
+    '''
+    The three histograms of a timed generator function.
+    '''
+    def __init__(self):
+        self.first = Histogram()
+        self.items = Histogram()
+        self.totals = Histogram()
+
+    def snapshot(self, calls):
+        '''
+        The totals snapshot (scaled to calls, as for sampled timers),
+        with the first-item and per-item snapshots under first and items.
+        '''
+        return dict(scaled(self.totals.snapshot(), calls),
+                    first=self.first.snapshot(), items=self.items.snapshot())
+
+    def reset(self):
+        for histogram in (self.first, self.items, self.totals):
+            histogram.reset()
+
+
+def timedgen(gen, stats, clock, done=None):
+    '''
+    Run generator gen, yielding its items and passing on send(),
+    throw() and close(), while timing each step into stats; done(spent)
+    is called at the end, after totals has the generator's total.
+    '''
+    (method, arg) = (gen.send, None)                    # send(None) == next()
+    spent = steps = 0
+    try:
+        while True:
+            start = clock()
+            try:
+                item = method(arg)
+            except StopIteration as stop:
+                spent += clock() - start
+                return stop.value
+            elapsed = clock() - start
+            if not steps:
+                stats.first.record(elapsed)
+            stats.items.record(elapsed)
+            spent += elapsed
+            steps += 1
+            try:
+                (method, arg) = (gen.send, (yield item))
+            except GeneratorExit:
+                raise
+            except BaseException as exc:                # Consumer's throw(): pass it in
+                (method, arg) = (gen.throw, exc)
+    finally:
+        gen.close()
+        stats.totals.record(spent)
+        if done:
+            done(spent)
@@ -8,24 +8,114 @@
 #--------------------------------------------
 
 
-import time
+'''
+Each call's time (time.perf_counter_ns) goes into a fixed-memory
+histogram (see histogram.py) instead of only a running total, so a
+timed function can run millions of times: snapshot() gives count,
+total, mean, p50, p90, p99 and max in seconds, reset() starts over, and
+alltime is still the total. trace=True prints every call, as before;
+it is off by default, since printing costs far more than the timing.
+sample_rate=N reads the clock on only 1 call in N -- every Nth call,
+or with randomly=True a random 1 in N, which can't fall in step with a
+caller's own cycle -- and scales the total back up by calls / samples;
+the other calls just bump a counter, so a hot function can stay timed.
+What a call costs over a bare one (measured on a 1-CPU VM, CPython
+3.11, bare call 40ns): about 330ns for any call, timed or not, for
+calling through Timer.__call__ and counting it; and a timed call about
+370ns more, half of it reading perf_counter_ns twice, the rest filing
+the time in the histogram (Histogram.record's code, inlined here to
+save a call). So about 700ns per timed call: for a function called
+millions of times, sample_rate=100 or so brings the average down to
+the 330ns floor.
+Async functions are timed until their coroutine completes, and
+generator functions step by step (see timedgen.py): their snapshot()
+is the total iteration time per generator, with time-to-first-item
+and per-item snapshots added under first and items. trace=True prints
+only plain and async calls. Each timer registers its snapshot() with
+the process-wide metrics registry (see metrics.py).
+'''
 
 
-def timer(label='', trace=True):            # on decorator args: retain args
+import time, random
+from histogram import Histogram, scaled, summary
+from timedgen import kind, GenStats, timedgen
+import metrics
+
+
+def timer(label='', trace=False, sample_rate=1, randomly=False):    # on decorator args: retain
+    chance = random.random
+    clock = time.perf_counter_ns
+    every = sample_rate if sample_rate > 1 and not randomly else 0      # Time every Nth call
+    odds = 1 / sample_rate if sample_rate > 1 and randomly else 0       # Or a random 1 in N
     class Timer:
         def __init__(self, func):           # on @: retain decorated func
             self.func = func
-            self.alltime = 0
+            self.kind = kind(func)
+            self.plain = self.kind == 'function'
+            self.histogram = Histogram()
+            self.gens = GenStats() if self.kind == 'generator' else None
+            self.calls = 0
+            metrics.timecalls(func, self.snapshot)
         def __call__(self, *args, **kwargs):    # on calls: call original function
-            start = time.time()
+            self.calls = calls = self.calls + 1
+            if every and calls % every or odds and chance() >= odds:
+                return self.func(*args, **kwargs)   # Not sampled: untimed, nothing else
+            if not self.plain:
+                if self.gens:
+                    return timedgen(self.func(*args, **kwargs), self.gens, clock)
+                return self.timeawait(args, kwargs)
+            start = clock()
             result = self.func(*args, **kwargs)
-            elapsed = time.time() - start
-            self.alltime += elapsed
+            elapsed = clock() - start
+            hist = self.histogram                   # Histogram.record, inlined: no call
+            shift = elapsed.bit_length() - hist.bits - 1
+            index = elapsed if shift <= 0 else (shift << hist.bits) + (elapsed >> shift)
+            hist.counts[index if index < hist.limit else hist.limit - 1] += 1
+            hist.count += 1
+            hist.total += elapsed
+            if elapsed > hist.max:
+                hist.max = elapsed
             if trace:
-                format = '%s %s: %.5f, %.5f'
-                values = (label, self.func.__name__, elapsed, self.alltime)
-                print(format % values)
+                self.show(elapsed)
             return result
+        async def timeawait(self, args, kwargs):
+            start = time.perf_counter_ns()
+            result = await self.func(*args, **kwargs)
+            elapsed = time.perf_counter_ns() - start
+            self.histogram.record(elapsed)
+            if trace:
+                self.show(elapsed)
+            return result
+        def show(self, elapsed):
+            format = '%s %s: %.5f, %.5f'
+            values = (label, self.func.__name__, elapsed / 1e9, self.alltime)
+            print(format % values)
+        @property
+        def alltime(self):                  # seconds, as before; estimated if sampled
+            return self.snapshot()['total']
+        def snapshot(self):
+            if self.gens:
+                return self.gens.snapshot(self.calls)
+            return scaled(self.histogram.snapshot(), self.calls)
+        def reset(self):
+            self.histogram.reset()
+            if self.gens:
+                self.gens.reset()
+            self.calls = 0
+        def __str__(self):
+            return '%s %s: %s' % (label, self.func.__name__, summary(self.snapshot()))
     return Timer
 
 
+
+if __name__ == '__main__':
+    def spam(x):
+        return x + 1
+    calls = 1000000
+    for (rate, randomly) in ((1, False), (100, False), (100, True)):
+        timed = timer('[%d%s]' % (rate, ' random' if randomly else ''), False, rate, randomly)(spam)
+        start = time.perf_counter()
+        for i in range(calls):
+            timed(i)
+        wall = time.perf_counter() - start
+        print('%s  wall %.3f sec, alltime %.3f sec' % (timed, wall, timed.alltime))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#---------------------------------------------
+# Usage: python3 timerdeco2_testgens.py
+# Description: timer decorator on generator and async functions
+#---------------------------------------------
+
+
+import asyncio
+
+from timerdeco2 import timer
+from histogram import summary
+
+
+@timer(label='[GGG]==>')
+def genesquares(num):                           # As in Chapter 20's generator_function.py
+    for i in range(num):
+        yield i ** 2
+
+
+def permute(seq):                               # Chapter 20's permute2, copied from permute.py
+    if not seq:
+        yield seq
+    else:
+        if not isinstance(seq, str):
+            seq = ''.join(str(x) for x in seq)
+        for i in range(len(seq)):
+            rest = seq[:i] + seq[i+1:]
+            for x in permute(rest):
+                yield seq[i] + x
+
+
+permute2 = timer(label='[PPP]==>')(permute)    # Recursive calls stay untimed
+
+
+@timer(label='[AAA]==>')
+async def fetch(delay):
+    await asyncio.sleep(delay)
+    return delay
+
+
+def bench_timedgens():                                   # python3 -m bench, from Chapter21
+    pairs = []
+    for (func, arg) in ((genesquares, 100000), (permute2, 'spamham')):
+        func.reset()
+        for x in func(arg):
+            pass
+        snap = func.snapshot()
+        pairs += [('%s total' % func.func.__name__, snap['total']),
+                  ('%s first item' % func.func.__name__, snap['first']['max']),
+                  ('%s item p99' % func.func.__name__, snap['items']['p99'])]
+    return pairs
+
+bench_timedgens.tags = ['decorators', 'generators']
+
+
+
+if __name__ == '__main__':
+    print(list(genesquares(5)))
+    for x in genesquares(100000):
+        pass
+    snap = genesquares.snapshot()
+    print('genesquares per generator: %s' % summary(snap))
+    print('    first item: %s' % summary(snap['first']))
+    print('    per item:   %s' % summary(snap['items']))
+
+    print(list(permute2('abc')))
+    for x in permute2('spamham'):
+        pass
+    snap = permute2.snapshot()
+    print('permute2 per generator: %s' % summary(snap))
+    print('    first item: %s' % summary(snap['first']))
+    print('    per item:   %s' % summary(snap['items']))
+
+    async def main():
+        return await asyncio.gather(*(fetch(delay) for delay in (0.01, 0.02, 0.03)))
+    print(asyncio.run(main()))
+    print('fetch: %s' % summary(fetch.snapshot()))
@@ -26,12 +26,25 @@ def mapcall(n):
     return force(map(lambda x: x * 2, range(n)))
 
 
-for func in listcomp, mapcall:
-    result = func(5)
-    func(50000)
-    func(500000)
-    func(1000000)
-    print(result)
-    print('allTime = %s\n' % func.alltime)
-
-print('map v.s. comp = %s' % round(mapcall.alltime / listcomp.alltime, 3))
+def bench_timerdeco():                                   # python3 -m bench, from Chapter21
+    for func in listcomp, mapcall:
+        func.reset()
+        for n in (5, 50000, 500000, 1000000):
+            func(n)
+    return [(func.func.__name__, func.alltime) for func in (listcomp, mapcall)]
+
+bench_timerdeco.tags = ['decorators', 'iteration']
+
+
+
+if __name__ == '__main__':
+    for func in listcomp, mapcall:
+        result = func(5)
+        func(50000)
+        func(500000)
+        func(1000000)
+        print(result)
+        print('allTime = %s' % func.alltime)
+        print('%s\n' % func)
+
+    print('map v.s. comp = %s' % round(mapcall.alltime / listcomp.alltime, 3))
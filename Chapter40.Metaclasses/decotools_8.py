@@ -9,31 +9,108 @@
 
 
 
-import time
+'''
+timer() records each call's time (time.perf_counter_ns) into a
+fixed-memory histogram (histogram.py, as in Chapter 39): the wrapper's
+snapshot() gives count, total, mean, p50, p90, p99 and max in seconds,
+reset() starts over, and alltime keeps the running total. Tracing is
+off by default; pass trace=True to print every call. sample_rate=N
+times only every Nth call (a random 1 in N if randomly=True), and
+scales alltime and the snapshot's total up by calls / samples.
+Async functions are timed until completion, and generator functions
+per step, as in Chapter 39's timerdeco2 (see timedgen.py): a
+generator's snapshot() adds first-item and per-item stats under first
+and items, and its alltime is updated as each generator finishes.
+Tracers and timers also register in the metrics.py registry.
+A tracer counts calls in a ShardedCounter (see counter.py),
+onCall.calls, which loses no counts under threads and takes no lock.
+'''
+
+
+import time, random
+from histogram import Histogram, scaled         # Copies of Chapter 39's modules
+from timedgen import kind, GenStats, timedgen
+import metrics
+from counter import ShardedCounter
 
 
 def tracer(func):               # use function, not class' __call__ method
-    calls = 0                   # else self is decorator instance only
+    calls = ShardedCounter()    # else self is decorator instance only
     def onCall(*args, **kwargs):
-        nonlocal calls
-        calls += 1
-        print('call %s to %s' % (calls, func.__name__))
+        calls.add()             # per-thread shard: no lost counts, no lock
+        print('call %s to %s' % (calls.value, func.__name__))
         return func(*args, **kwargs)
+    onCall.calls = calls
+    metrics.countcalls(func, lambda: calls.value)
     return onCall
 
 
-def timer(label='', trace=True):            # on decorator args: retain args
+def timer(label='', trace=False, sample_rate=1, randomly=False):    # on decorator args: retain
+    chance = random.random
     def onDecorator(func):                  # on @ retain decorated func
-        def onCall(*args, **kwargs):        # on calls: call original
-            start = time.time()             # state is scopes + func attr
-            result = func(*args, **kwargs)
-            elapsed = time.time() - start
-            onCall.alltime += elapsed
+        histogram = Histogram()
+        gens = GenStats()
+        calls = 0
+        def skip():                         # count the call; True: leave untimed
+            nonlocal calls
+            calls += 1
+            return sample_rate > 1 and (chance() * sample_rate >= 1 if randomly
+                                        else calls % sample_rate)
+        def record(elapsed):
+            histogram.record(elapsed)
+            onCall.alltime = histogram.total * calls / histogram.count / 1e9
             if trace:
-                format = '%s%s: %.5f, %.5f'
-                values = (label, func.__name__, elapsed, onCall.alltime)
-                print(format % values)
-            return result
+                show(elapsed)
+        def show(elapsed):
+            format = '%s%s: %.5f, %.5f'
+            values = (label, func.__name__, elapsed / 1e9, onCall.alltime)
+            print(format % values)
+        def finished(spent):                # a timed generator is done
+            onCall.alltime = gens.totals.total * calls / gens.totals.count / 1e9
+
+        if kind(func) == 'async':
+            async def onCall(*args, **kwargs):
+                if skip():
+                    return await func(*args, **kwargs)
+                start = time.perf_counter_ns()
+                result = await func(*args, **kwargs)
+                record(time.perf_counter_ns() - start)
+                return result
+        elif kind(func) == 'generator':
+            def onCall(*args, **kwargs):
+                if skip():
+                    return func(*args, **kwargs)
+                return timedgen(func(*args, **kwargs), gens, time.perf_counter_ns, finished)
+        else:                               # hot path: skip() and record() inlined
+            def onCall(*args, **kwargs):    # on calls: call original
+                nonlocal calls
+                calls += 1
+                if sample_rate > 1 and (chance() * sample_rate >= 1 if randomly
+                                        else calls % sample_rate):
+                    return func(*args, **kwargs)    # not sampled: untimed
+                start = time.perf_counter_ns()  # state is scopes + func attr
+                result = func(*args, **kwargs)
+                elapsed = time.perf_counter_ns() - start
+                histogram.record(elapsed)
+                onCall.alltime = histogram.total * calls / histogram.count / 1e9
+                if trace:
+                    show(elapsed)
+                return result
+
+        def snapshot():
+            if kind(func) == 'generator':
+                return gens.snapshot(calls)
+            return scaled(histogram.snapshot(), calls)
+        def reset():
+            nonlocal calls
+            histogram.reset()
+            gens.reset()
+            calls = 0
+            onCall.alltime = 0
         onCall.alltime = 0
+        onCall.histogram = histogram
+        onCall.snapshot = snapshot
+        onCall.reset = reset
+        metrics.timecalls(func, snapshot)
         return onCall
     return onDecorator
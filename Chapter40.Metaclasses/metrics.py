@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+#encoding=utf-8
+
+
+#--------------------------------------------
+# Usage: python3 metrics.py [-serve PORT] [-dump FILE]
+# Description: process-wide registry of decorator counters and timings
+#--------------------------------------------
+
+
+
+'''
+The tracers' call counters and the timers' histograms live as state on
+each wrapper; this module's registry lets anything in the process see
+them. The decorators register themselves when they decorate: a tracer
+adds a counter, decorator_calls_total, and a timer a summary,
+decorator_call_seconds (with p50, p90 and p99 quantiles, _sum, _count,
+and a _max gauge), plus per-item and first-item summaries for
+generator functions -- each labeled function="module.qualname".
+Registration stores only a function that reads the wrapper's state
+when asked, so a registered decorator pays nothing more per call.
+render() writes all of it in the Prometheus text exposition format;
+serve() answers GET /metrics with it from a small HTTP server thread,
+for a Prometheus scrape, and dump() writes it to a file, atomically
+(as node_exporter's textfile collector wants), once or every interval
+seconds. Decorating another function under the same name and labels
+replaces the older entry.
+'''
+
+
+import os, threading, collections
+
+
+class Registry:
+    def __init__(self):
+        self.families = collections.OrderedDict()      # name => [kind, help, {labels: collect}]
+        self.lock = threading.Lock()
+
+    def register(self, kind, name, help, collect, labels):
+        with self.lock:
+            family = self.families.setdefault(name, [kind, help, collections.OrderedDict()])
+            family[2][tuple(sorted(labels.items()))] = collect
+
+    def counter(self, name, help, collect, **labels):
+        '''
+        collect() returns the counter's current value.
+        '''
+        self.register('counter', name, help, collect, labels)
+
+    def summary(self, name, help, collect, **labels):
+        '''
+        collect() returns a histogram snapshot (see histogram.py).
+        '''
+        self.register('summary', name, help, collect, labels)
+
+    def unregister(self, name, **labels):
+        with self.lock:
+            self.families.get(name, [None, None, {}])[2].pop(tuple(sorted(labels.items())), None)
+
+    def render(self):
+        '''
+        Every registered metric, in Prometheus text format.
+        '''
+        with self.lock:
+            families = [(name, kind, help, list(members.items()))
+                        for (name, (kind, help, members)) in self.families.items()]
+        lines = []
+        for (name, kind, help, members) in families:
+            if not members:
+                continue
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, kind))
+            maxes = []
+            for (labels, collect) in members:
+                if kind == 'counter':
+                    lines.append('%s%s %s' % (name, showlabels(labels), collect()))
+                    continue
+                snap = collect()
+                for (key, quantile) in (('p50', '0.5'), ('p90', '0.9'), ('p99', '0.99')):
+                    lines.append('%s%s %r' % (name, showlabels(labels + (('quantile', quantile),)),
+                                              snap[key]))
+                lines.append('%s_sum%s %r' % (name, showlabels(labels), snap['total']))
+                lines.append('%s_count%s %d' % (name, showlabels(labels), snap['count']))
+                maxes.append('%s_max%s %r' % (name, showlabels(labels), snap['max']))
+            if maxes:
+                lines.append('# HELP %s_max Longest single time seen, in seconds.' % name)
+                lines.append('# TYPE %s_max gauge' % name)
+                lines.extend(maxes)
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def showlabels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, escape(value)) for (key, value) in labels)
+
+
+registry = Registry()                                   # The process-wide one
+
+
+
+def funcname(func):
+    return '%s.%s' % (func.__module__, getattr(func, '__qualname__', func.__name__))
+
+
+def countcalls(func, collect, decorator='tracer'):
+    '''
+    Register a tracer's call counter for func; collect() reads it.
+    '''
+    registry.counter('decorator_calls_total', 'Calls made to a decorated function.',
+                     collect, function=funcname(func), decorator=decorator)
+
+
+def timecalls(func, snapshot, decorator='timer'):
+    '''
+    Register a timer's snapshot() for func: one summary, or three for
+    a generator function's timer, whose snapshot has first and items.
+    '''
+    labels = dict(function=funcname(func), decorator=decorator)
+    registry.summary('decorator_call_seconds', 'Time per call of a decorated function, '
+                     'to completion for async and generator functions.', snapshot, **labels)
+    if 'first' in snapshot():
+        registry.summary('decorator_generator_first_item_seconds',
+                         'Time to the first item of a decorated generator.',
+                         lambda: snapshot()['first'], **labels)
+        registry.summary('decorator_generator_item_seconds',
+                         'Time per item of a decorated generator.',
+                         lambda: snapshot()['items'], **labels)
+
+
+
+def serve(port=9464, host='127.0.0.1', registry=registry):
+    '''
+    Answer GET /metrics on host:port from a daemon thread; returns the
+    server (its server_address has the port, if 0 picked a free one).
+    '''
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/metrics', '/'):
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, format, *args):          # Quiet: no line per scrape
+            pass
+
+    server = HTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def dump(filename, interval=None, registry=registry):
+    '''
+    Write render() to filename via a temporary file and a rename, so a
+    reader never sees half a file; given interval, keep doing so every
+    interval seconds from a daemon thread, and return an Event that
+    stops it when set.
+    '''
+    def write():
+        temp = '%s.%d.tmp' % (filename, os.getpid())
+        with open(temp, 'w') as file:
+            file.write(registry.render())
+        os.replace(temp, filename)
+
+    write()
+    if interval is None:
+        return None
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            write()
+    thread = threading.Thread(target=loop)
+    thread.daemon = True
+    thread.start()
+    return stop
+
+
+
+if __name__ == '__main__':
+    import sys, time
+    import metrics                                      # The copy the decorators register in
+    from decotools_8 import timer
+
+    @timer()
+    def spam(n):
+        return sum(range(n))
+
+    def eggs():
+        for i in range(3):
+            yield i
+    eggs = timer()(eggs)
+
+    for i in range(1000):
+        spam(i)
+    list(eggs())
+    if '-dump' in sys.argv:
+        metrics.dump(sys.argv[sys.argv.index('-dump') + 1])
+    if '-serve' in sys.argv:
+        server = metrics.serve(int(sys.argv[sys.argv.index('-serve') + 1]))
+        print('serving http://%s:%d/metrics, ^C to stop' % server.server_address[:2])
+        while True:
+            spam(1000)
+            time.sleep(0.01)
+    print(metrics.registry.render(), end='')